@@ -0,0 +1,356 @@
+# benchmark.py
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from rfq_metrics import peak_rss_mb
+
+REFERENCE_PATH = "data/reference_properties.tsv"
+
+NUMERIC_COLS = [
+    "thickness_min", "thickness_max", "width_min", "width_max", "length_min", "length_max",
+    "height_min", "height_max", "weight_min", "weight_max",
+    "inner_diameter_min", "inner_diameter_max", "outer_diameter_min", "outer_diameter_max",
+    "tensile_mid", "yield_mid", "elongation_mid", "reduction_mid", "hardness_mid"
+]
+CAT_COLS = ["coating", "finish", "form", "surface_type", "surface_protection"]
+
+# ---------- stages ----------
+# Each stage does its untimed setup and returns (callable to time, rows, pairs scored),
+# optionally followed by a dict of extra fields for the record.
+def _enriched(paths):
+    import rfq_store
+    return rfq_store.load_or_enrich(paths["rfq"], REFERENCE_PATH, paths["store"])
+
+def _compact(paths):
+    import rfq_compact
+    return rfq_compact.compact_enriched(_enriched(paths))
+
+def stage_enrich_rfq(paths):
+    import rfq_final
+    n = sum(1 for _ in open(paths["rfq"], encoding="utf-8")) - 1
+    return (lambda: rfq_final.enrich_rfq(paths["rfq"], REFERENCE_PATH)), n, 0
+
+def stage_similarity(paths, compact=False):
+    import rfq_final
+    from rfq_compact import frame_memory_mb
+    df = _compact(paths) if compact else _enriched(paths)
+    return (lambda: rfq_final.compute_top3_similarity(df)), len(df), len(df) ** 2, \
+        {"frame_mb": frame_memory_mb(df)}
+
+def stage_similarity_pruned(paths):
+    import rfq_engine
+    df = _enriched(paths)
+    extra = {}
+    # The pruning rate lands in the record through ``extra``
+    run = lambda: extra.update(rfq_engine.pruned_top_k(df, return_stats=True)[1])
+    return run, len(df), len(df) ** 2, extra
+
+def stage_similarity_dedupe(paths):
+    import rfq_dedupe
+    df = _enriched(paths)
+    extra = {}
+    # Rows, distinct rows and unique_ratio land in the record through ``extra``
+    run = lambda: extra.update(rfq_dedupe.deduplicated_top_k(df, return_stats=True)[1])
+    return run, len(df), len(df) ** 2, extra
+
+def stage_ablation(paths, compact=False):
+    import rfq_ablation
+    from rfq_compact import frame_memory_mb
+    df = _compact(paths) if compact else _enriched(paths)
+    return (lambda: rfq_ablation.ablation_similarity(df, mode="all")), len(df), len(df) ** 2, \
+        {"frame_mb": frame_memory_mb(df)}
+
+def stage_similarity_compact(paths):
+    return stage_similarity(paths, compact=True)
+
+def stage_ablation_compact(paths):
+    return stage_ablation(paths, compact=True)
+
+def stage_cosine_jaccard(paths):
+    import rfq_alternative
+    df = _enriched(paths)
+    num = [c for c in NUMERIC_COLS if c in df.columns]
+    cat = [c for c in CAT_COLS if c in df.columns]
+    return (lambda: rfq_alternative.compute_top3_cosine_jaccard(df, num, cat)), len(df), len(df) ** 2
+
+def _stand_in_top_k(paths, k=3, seed=0):
+    """Book ids with random top-k arrays, so the output stages run at sizes where scoring all pairs does not."""
+    import numpy as np
+    ids = _enriched(paths)["id"].to_numpy()
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(ids), size=(len(ids), k))
+    vals = -np.sort(-rng.random((len(ids), k)), axis=1)
+    return ids, idx, vals, os.path.dirname(paths["rfq"])
+
+def _size_mb(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2 ** 20
+    return os.path.getsize(path) / 2 ** 20
+
+def stage_write_topk_csv(paths):
+    import numpy as np
+    import rfq_engine
+    ids, idx, vals, out_dir = _stand_in_top_k(paths)
+    out, extra = os.path.join(out_dir, "top3.csv"), {}
+
+    def run():
+        # What run.py does with the engine's output: frame, sort, CSV
+        frame = rfq_engine.top_k_frame({"ids": ids}, np.arange(len(ids)), idx, vals)
+        frame.sort_values(by=['rfq_id', 'similarity_score'], ascending=[True, False]) \
+            .reset_index(drop=True).to_csv(out, index=False)
+        extra["output_mb"] = _size_mb(out)
+    return run, len(ids), 0, extra
+
+def stage_write_topk_binary(paths):
+    import numpy as np
+    import rfq_topk
+    ids, idx, vals, out_dir = _stand_in_top_k(paths)
+    out, extra = os.path.join(out_dir, "top3.topk"), {}
+
+    def run():
+        with rfq_topk.TopKWriter(out, ids, idx.shape[1]) as writer:
+            for lo in range(0, len(ids), 4096):
+                rows = np.arange(lo, min(lo + 4096, len(ids)))
+                writer.write(rows, idx[rows], vals[rows])
+        extra["output_mb"] = _size_mb(out)
+    return run, len(ids), 0, extra
+
+def _grade_variants(grades, share=0.3, seed=0):
+    """Respell a ``share`` of the grades the way free-text RFQs do (case, separators, coating suffix)."""
+    import numpy as np
+    import re
+    rng = np.random.default_rng(seed)
+    styles = [lambda g: f" {g.lower()} ",
+              lambda g: re.sub(r"(\d)(?=[A-Z])", r"\1-", g, count=1),
+              lambda g: re.sub(r"(?<=[A-Z])(\d)", r" \1", g, count=1),
+              lambda g: f"{g}+Z275"]
+    pick = np.where(rng.random(len(grades)) < share, rng.integers(0, len(styles), len(grades)), -1)
+    return [styles[p](g) if p >= 0 and isinstance(g, str) else g for g, p in zip(grades, pick)]
+
+def stage_grade_resolution(paths):
+    import pandas as pd
+    import rfq_grades
+    rfq = pd.read_csv(paths["rfq"], usecols=["grade", "grade_suffix"])
+    grades = pd.Series(_grade_variants(rfq["grade"].tolist()), dtype=object)
+    reference = pd.read_csv(REFERENCE_PATH, sep='\t', usecols=['Grade/Material'])['Grade/Material'].dropna()
+    extra = {}
+
+    def run():
+        # A fresh index each run, so build time and cold memo lookups are both timed
+        index = rfq_grades.GradeIndex(reference.astype(str).tolist())
+        index.resolve_series(grades, rfq["grade_suffix"])
+        extra.update(index.match_stats(grades, rfq["grade_suffix"]))
+    return run, len(grades), 0, extra
+
+def stage_cluster(paths):
+    import rfq_clustering
+    df = _enriched(paths)
+    return (lambda: rfq_clustering.cluster_rfq(df, n_clusters=5)), len(df), 0
+
+def stage_cluster_minibatch(paths):
+    import rfq_clustering
+    df = _enriched(paths)
+    return (lambda: rfq_clustering.cluster_rfq(df, n_clusters=5, mode="minibatch")), len(df), 0
+
+def stage_index_query(paths):
+    import pandas as pd
+    import rfq_lookup
+    index_dir = os.path.join(os.path.dirname(paths["rfq"]), "similarity_index")
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        rfq_lookup.SimilarityIndex.build(_enriched(paths), REFERENCE_PATH).save(index_dir)
+    queries = pd.read_csv(paths["rfq"], nrows=200)
+    extra = {}
+    # Load time and latency percentiles land in the record through ``extra``
+    return (lambda: extra.update(rfq_lookup.benchmark_queries(index_dir, queries))), len(queries), 0, extra
+
+def stage_service(paths):
+    import asyncio
+    import pandas as pd
+    import rfq_lookup
+    import rfq_service
+    index_dir = os.path.join(os.path.dirname(paths["rfq"]), "similarity_index")
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        rfq_lookup.SimilarityIndex.build(_enriched(paths), REFERENCE_PATH).save(index_dir)
+    index = rfq_lookup.SimilarityIndex.load(index_dir, mmap=False)
+    queries = pd.read_csv(paths["rfq"], nrows=200)
+    extra = {}
+    # One load-generator record per concurrency level, unbatched then batched
+    run = lambda: extra.update(service=asyncio.run(rfq_service.benchmark_service(index, queries, 200, (1, 32))))
+    return run, 4 * 200, 0, extra
+
+def stage_build_inventory(paths):
+    import scenario_a_run
+    out = os.path.join(os.path.dirname(paths["rfq"]), "inventory_dataset.csv")
+    return (lambda: scenario_a_run.build_inventory(paths["supplier1"], paths["supplier2"], out)), \
+        paths["supplier_rows"] * 2, 0
+
+# name -> (stage function, scores all pairs)
+STAGES = {
+    "enrich_rfq": (stage_enrich_rfq, False),
+    "compute_top3_similarity": (stage_similarity, True),
+    "compute_top3_similarity_compact": (stage_similarity_compact, True),
+    "compute_top3_similarity_pruned": (stage_similarity_pruned, True),
+    "compute_top3_similarity_dedupe": (stage_similarity_dedupe, True),
+    "ablation_similarity": (stage_ablation, True),
+    "ablation_similarity_compact": (stage_ablation_compact, True),
+    "compute_top3_cosine_jaccard": (stage_cosine_jaccard, True),
+    "cluster_rfq": (stage_cluster, False),
+    "cluster_rfq_minibatch": (stage_cluster_minibatch, False),
+    "similarity_index_query": (stage_index_query, False),
+    "similarity_service": (stage_service, False),
+    "write_topk_csv": (stage_write_topk_csv, False),
+    "write_topk_binary": (stage_write_topk_binary, False),
+    "grade_resolution": (stage_grade_resolution, False),
+    "build_inventory": (stage_build_inventory, False),
+}
+
+# ---------- measurement ----------
+def _measure(stage, paths):
+    """Run one stage in the current (fresh) process and return its metrics."""
+    func, rows, pairs, *extra = STAGES[stage][0](paths)
+    rss_before = peak_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    func()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {
+        "seconds": wall,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": peak_rss_mb(),
+        "setup_peak_rss_mb": rss_before,
+        "rows": rows,
+        "rows_per_second": rows / wall if wall > 0 else None,
+        "pairs_per_second": pairs / wall if pairs and wall > 0 else None,
+        **(extra[0] if extra else {}),
+    }
+
+def run_benchmarks(sizes, stages, data_dir="bench_data", max_pairwise=20000, seed=0, supplier_rows=None):
+    """Time every stage at every size, each in its own process so peak RSS is per stage."""
+    import rfq_synthetic
+
+    results = []
+    for size in sizes:
+        size_dir = os.path.join(data_dir, f"n{size}")
+        n_sup = size if supplier_rows is None else supplier_rows
+        paths = {
+            "rfq": os.path.join(size_dir, "rfq.csv"),
+            "supplier1": os.path.join(size_dir, "supplier_data1.xlsx"),
+            "supplier2": os.path.join(size_dir, "supplier_data2.xlsx"),
+            "store": os.path.join(size_dir, "rfq_enriched_store"),
+            "supplier_rows": n_sup,
+        }
+        if not all(os.path.exists(paths[p]) for p in ["rfq", "supplier1", "supplier2"]):
+            rfq_synthetic.write_dataset(size, size_dir, seed=seed, supplier_rows=n_sup)
+
+        for stage in stages:
+            record = {"stage": stage, "size": size}
+            if STAGES[stage][1] and size > max_pairwise:
+                record["status"] = "skipped"
+            else:
+                with get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+                    record.update(pool.apply(_measure, (stage, paths)))
+                record["status"] = "ok"
+            results.append(record)
+            print(f"[OK] {stage} n={size}: {record.get('seconds', 'skipped')}")
+    return results
+
+# ---------- import time ----------
+# Heavy optional packages whose loading is reported per subcommand
+HEAVY_MODULES = ["pandas", "numpy", "scipy", "sklearn", "openpyxl"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import cli
+if sys.argv[1] != "help":
+    cli.import_modules(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "loaded": [m for m in %r if m in sys.modules]}))
+""" % HEAVY_MODULES
+
+def measure_imports(commands, repeat=3):
+    """Import time of each cli subcommand's modules in a fresh interpreter (best of ``repeat``).
+
+    "help" is the bare entry point, i.e. what ``python cli.py --help`` pays.
+    """
+    results = []
+    for command in ["help"] + list(commands):
+        runs = [json.loads(subprocess.run([sys.executable, "-c", _IMPORT_PROBE, command], check=True,
+                                          capture_output=True, text=True).stdout)
+                for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        results.append({"command": command, "import_seconds": best["seconds"], "loaded": best["loaded"]})
+        print(f"[OK] import {command}: {best['seconds']:.3f}s ({', '.join(best['loaded']) or 'stdlib only'})")
+    return results
+
+# ---------- baseline ----------
+def compare_to_baseline(results, baseline, tolerance=1.25, min_seconds=0.05):
+    """Stage/size pairs whose wall time exceeds the baseline by more than ``tolerance``.
+
+    Runs faster than ``min_seconds`` in the baseline are ignored as timer noise.
+    """
+    previous = {(r["stage"], r["size"]): r for r in baseline["results"] if r.get("status") == "ok"}
+    regressions = []
+    for r in results:
+        base = previous.get((r["stage"], r["size"]))
+        if r.get("status") != "ok" or base is None or base["seconds"] < min_seconds:
+            continue
+        ratio = r["seconds"] / base["seconds"]
+        if ratio > tolerance:
+            regressions.append({"stage": r["stage"], "size": r["size"], "seconds": r["seconds"],
+                                "baseline_seconds": base["seconds"], "ratio": ratio})
+    return regressions
+
+def machine_info():
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+# ---------- run ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--data-dir", default="bench_data")
+    parser.add_argument("--max-pairwise", type=int, default=20000,
+                        help="largest size at which all-pairs similarity stages are run")
+    parser.add_argument("--supplier-rows", type=int, default=None)
+    parser.add_argument("--output", default="outputs/benchmarks/results.json")
+    parser.add_argument("--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--save-baseline", default=None, help="also write results to this path")
+    parser.add_argument("--imports", action="store_true",
+                        help="also measure import time of every cli.py subcommand")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.stages, args.data_dir, args.max_pairwise,
+                             supplier_rows=args.supplier_rows)
+    report = {"machine": machine_info(), "results": results}
+    if args.imports:
+        import cli
+        report["imports"] = measure_imports(cli.SUBCOMMAND_MODULES)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] benchmark results saved to {path}")
+
+    for r in regressions:
+        print(f"[REGRESSION] {r['stage']} n={r['size']}: {r['seconds']:.3f}s "
+              f"vs {r['baseline_seconds']:.3f}s ({r['ratio']:.2f}x)")
+    sys.exit(1 if regressions else 0)
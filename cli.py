@@ -0,0 +1,221 @@
+# cli.py
+import argparse
+import importlib
+import os
+import sys
+
+# Modules each subcommand needs. Nothing heavy is imported until a subcommand runs,
+# so `--help` and argument errors stay cheap, and sklearn/openpyxl are only loaded
+# by the subcommands that use them.
+SUBCOMMAND_MODULES = {
+    "inventory": ["scenario_a_run"],
+    "enrich": ["rfq_store"],
+    "similarity": ["run"],
+    "ablation": ["rfq_ablation", "rfq_store"],
+    "alternative": ["rfq_alternative", "rfq_store"],
+    "cluster": ["rfq_clustering", "rfq_store"],
+    "serve": ["rfq_service"],
+    "topk-csv": ["rfq_topk"],
+}
+
+NUMERIC_COLS = [
+    "thickness_min", "thickness_max", "width_min", "width_max", "length_min", "length_max",
+    "height_min", "height_max", "weight_min", "weight_max",
+    "inner_diameter_min", "inner_diameter_max", "outer_diameter_min", "outer_diameter_max",
+    "tensile_mid", "yield_mid", "elongation_mid", "reduction_mid", "hardness_mid"
+]
+CAT_COLS = ["coating", "finish", "form", "surface_type", "surface_protection"]
+
+# ---------- helpers ----------
+def import_modules(command):
+    """Import the modules behind ``command`` and return them in SUBCOMMAND_MODULES order."""
+    return [importlib.import_module(name) for name in SUBCOMMAND_MODULES[command]]
+
+def parse_weights(text):
+    """``dim=0.4,cat=0.3,grade=0.3`` -> {"dim": 0.4, "cat": 0.3, "grade": 0.3}."""
+    weights = {}
+    for part in filter(None, text.split(",")):
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"expected key=value, got {part!r}")
+        weights[key.strip()] = float(value)
+    return weights
+
+def _load_enriched(args):
+    rfq_store, = import_modules("enrich")
+    return rfq_store.load_or_enrich(os.path.join(args.data_dir, "rfq.csv"),
+                                    os.path.join(args.data_dir, "reference_properties.tsv"),
+                                    os.path.join(args.out_dir, "rfq_enriched_store"),
+                                    cache_dir=os.path.join(args.out_dir, "cache"))
+
+def _check_weights(weights, keys):
+    if weights is not None and set(weights) != set(keys):
+        sys.exit(f"--weights needs exactly the keys {', '.join(keys)}")
+
+# ---------- subcommands ----------
+def cmd_inventory(args):
+    scenario_a_run, = import_modules("inventory")
+    file1 = os.path.join(args.data_dir, "supplier_data1.xlsx")
+    file2 = os.path.join(args.data_dir, "supplier_data2.xlsx")
+    out_path = os.path.join(args.out_dir, "inventory_dataset.csv")
+    reference = os.path.join(args.data_dir, "reference_properties.tsv")
+    reference = reference if os.path.exists(reference) else None
+    os.makedirs(args.out_dir, exist_ok=True)
+    if args.streaming:
+        scenario_a_run.build_inventory_streaming(file1, file2, out_path, chunk_rows=args.chunk_size or 50000,
+                                                 workers=args.workers or 2, reference_path=reference)
+    else:
+        scenario_a_run.build_inventory(file1, file2, out_path, reference_path=reference)
+
+def cmd_enrich(args):
+    rfq_enriched = _load_enriched(args)
+    print(f"Enriched RFQ stored in {os.path.join(args.out_dir, 'rfq_enriched_store')}")
+    if not args.no_csv:
+        path = os.path.join(args.out_dir, "rfq_enriched.csv")
+        rfq_enriched.to_csv(path, index=False)
+        print(f"Enriched RFQ saved to {path}")
+
+def cmd_similarity(args):
+    run, = import_modules("similarity")
+    _check_weights(args.weights, ["dim", "cat", "grade"])
+    run.main(write_csv=not args.no_csv, metrics_path=args.metrics, data_folder=args.data_dir,
+             outputs_folder=args.out_dir, k=args.k, weights=args.weights, block_size=args.chunk_size,
+             workers=args.workers, incremental=args.incremental, engine=args.engine,
+             dedupe=args.dedupe, output_format=args.format)
+
+def cmd_ablation(args):
+    rfq_ablation, _ = import_modules("ablation")
+    _check_weights(args.weights, ["dim", "cat", "grade"])
+    rfq_enriched = _load_enriched(args)
+    weight_grid = [args.weights] if args.weights else []
+    results = rfq_ablation.run_ablation(rfq_enriched, modes=args.modes, weight_grid=weight_grid, k=args.k,
+                                        block_size=args.chunk_size, dedupe=args.dedupe)
+    for label, df in results.items():
+        out_path = os.path.join(args.out_dir, f"top{args.k}_{label}.csv")
+        df.to_csv(out_path, index=False)
+        print(f"[OK] Saved {out_path} with {len(df)} rows")
+
+def cmd_alternative(args):
+    rfq_alternative, _ = import_modules("alternative")
+    _check_weights(args.weights, ["cosine", "jaccard"])
+    weights = args.weights or {"cosine": 0.6, "jaccard": 0.4}
+    rfq_enriched = _load_enriched(args)
+    numeric_cols = [col for col in NUMERIC_COLS if col in rfq_enriched.columns]
+    cat_cols = [col for col in CAT_COLS if col in rfq_enriched.columns]
+    top = rfq_alternative.compute_top3_cosine_jaccard(
+        rfq_enriched, numeric_cols, cat_cols, weight_cosine=weights["cosine"], weight_jacc=weights["jaccard"],
+        workers=args.workers, block_size=args.chunk_size, k=args.k, dedupe=args.dedupe)
+    out_path = os.path.join(args.out_dir, f"top{args.k}_cosine_jaccard.csv")
+    top.to_csv(out_path, index=False)
+    print(f"Top-{args.k} cosine+jaccard similarity saved to {out_path}")
+
+def cmd_cluster(args):
+    rfq_clustering, _ = import_modules("cluster")
+    rfq_enriched = _load_enriched(args)
+    chunk_size = args.chunk_size or rfq_clustering.CHUNK_SIZE
+    if args.assign:
+        clustered = rfq_clustering.assign_clusters(rfq_enriched, args.assign, chunk_size)
+    else:
+        clustered, _ = rfq_clustering.cluster_rfq(rfq_enriched, n_clusters=args.n_clusters, mode=args.mode,
+                                                  chunk_size=chunk_size, model_path=args.model)
+    out_path = os.path.join(args.out_dir, "rfq_clustered.csv")
+    clustered.to_csv(out_path, index=False)
+    print(f"Clustered RFQs saved to {out_path}")
+    print("\n=== Cluster Interpretation ===")
+    print(rfq_clustering.cluster_summary(clustered))
+
+def cmd_serve(args):
+    rfq_service, = import_modules("serve")
+    index_dir = args.index or os.path.join(args.out_dir, "similarity_index")
+    index = rfq_service.open_index(index_dir, os.path.join(args.data_dir, "rfq.csv"),
+                                   os.path.join(args.data_dir, "reference_properties.tsv"),
+                                   os.path.join(args.out_dir, "rfq_enriched_store"),
+                                   os.path.join(args.out_dir, "cache"))
+    rfq_service.serve(index, args.host, args.port, args.socket, window_ms=args.window_ms,
+                      max_batch=args.max_batch, max_pending=args.max_pending)
+
+def cmd_topk_csv(args):
+    rfq_topk, = import_modules("topk-csv")
+    out_path = args.output or args.path.rstrip(os.sep).rsplit(".topk", 1)[0] + ".csv"
+    rfq_topk.convert_to_csv(args.path, out_path)
+    print(f"Top-k CSV saved to {out_path}")
+
+# ---------- parser ----------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Vanilla Steel RFQ pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--data-dir", default="data", help="folder with rfq.csv, reference and supplier files")
+    common.add_argument("--out-dir", default="outputs")
+
+    # Only on the subcommands that pass them through
+    chunking = argparse.ArgumentParser(add_help=False)
+    chunking.add_argument("--chunk-size", type=int, default=None,
+                          help="rows per block/chunk (similarity block size, inventory chunk rows, cluster chunk)")
+    parallel = argparse.ArgumentParser(add_help=False)
+    parallel.add_argument("--workers", type=int, default=None)
+
+    scoring = argparse.ArgumentParser(add_help=False)
+    scoring.add_argument("--k", type=int, default=3, help="matches kept per RFQ")
+    scoring.add_argument("--dedupe", action="store_true", help="score each distinct feature row once")
+    scoring.add_argument("--weights", type=parse_weights, default=None,
+                         help="e.g. dim=0.4,cat=0.3,grade=0.3 (alternative: cosine=0.6,jaccard=0.4)")
+
+    p = sub.add_parser("inventory", parents=[common, chunking, parallel], help="clean and merge supplier inventories")
+    p.add_argument("--streaming", action="store_true")
+    p.set_defaults(func=cmd_inventory)
+
+    p = sub.add_parser("enrich", parents=[common], help="enrich RFQs with grade reference data")
+    p.add_argument("--no-csv", action="store_true")
+    p.set_defaults(func=cmd_enrich)
+
+    p = sub.add_parser("similarity", parents=[common, chunking, parallel, scoring], help="top-k similar RFQs (run.py)")
+    p.add_argument("--no-csv", action="store_true", help="skip the rfq_enriched.csv export")
+    p.add_argument("--metrics", default=None)
+    p.add_argument("--incremental", action="store_true",
+                   help="rescore only RFQs added/changed since the last incremental run")
+    p.add_argument("--engine", choices=["numpy", "pruned", "loop"], default="numpy",
+                   help="pruned: exact top-k that skips candidates by score upper bound")
+    p.add_argument("--format", choices=["csv", "binary"], default="csv",
+                   help="binary: stream top-k to <out-dir>/top{k}.topk (int32 indices, float32 scores)")
+    p.set_defaults(func=cmd_similarity)
+
+    p = sub.add_parser("ablation", parents=[common, chunking, scoring], help="top-k per ablation mode")
+    p.add_argument("--modes", nargs="+", default=["dimensions", "grade", "categorical", "all"],
+                   choices=["dimensions", "grade", "categorical", "all"])
+    p.set_defaults(func=cmd_ablation)
+
+    p = sub.add_parser("alternative", parents=[common, chunking, parallel, scoring], help="cosine+jaccard top-k")
+    p.set_defaults(func=cmd_alternative)
+
+    p = sub.add_parser("cluster", parents=[common, chunking], help="cluster RFQs into families")
+    p.add_argument("--mode", choices=["kmeans", "minibatch"], default="kmeans")
+    p.add_argument("--n-clusters", type=int, default=5)
+    p.add_argument("--model", default=None, help="save the fitted pipeline here (joblib)")
+    p.add_argument("--assign", default=None, help="label RFQs with a saved pipeline instead of fitting")
+    p.set_defaults(func=cmd_cluster)
+
+    p = sub.add_parser("serve", parents=[common], help="micro-batching match service (rfq_service.py)")
+    p.add_argument("--index", default=None,
+                   help="saved SimilarityIndex, built if missing (default: <out-dir>/similarity_index)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--socket", default=None, help="Unix socket path instead of TCP")
+    p.add_argument("--window-ms", type=float, default=1.0)
+    p.add_argument("--max-batch", type=int, default=64)
+    p.add_argument("--max-pending", type=int, default=1024)
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("topk-csv", help="convert a binary top-k directory (rfq_topk.py) to the CSV layout")
+    p.add_argument("path", help="e.g. outputs/top3.topk")
+    p.add_argument("--output", default=None, help="CSV path (default: <path without .topk>.csv)")
+    p.set_defaults(func=cmd_topk_csv)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
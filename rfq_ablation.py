@@ -1,7 +1,12 @@
 # rfq_ablation.py
 import pandas as pd
 import numpy as np
+import json
 import os
+import rfq_engine
+import rfq_store
+
+COMPONENTS = ["dim", "cat", "grade"]
 
 # ---------- helpers ----------
 def interval_overlap(min1, max1, min2, max2):
@@ -12,7 +17,37 @@ def interval_overlap(min1, max1, min2, max2):
     return overlap / total if total > 0 else 0
 
 # ---------- ablation similarity ----------
-def ablation_similarity(rfq_enriched, mode="all", weights=None):
+def ablation_similarity(rfq_enriched, mode="all", weights=None, engine="numpy",
+                        block_size=None, col_block_size=None, out_dir=None, workers=None, k=3, dedupe=False):
+    """Top-3 (or top-``k``) similarity for one ablation mode ("dimensions", "grade", "categorical", "all").
+
+    engine="numpy" uses the block-wise engine in rfq_engine (streamed to ``out_dir``
+    in resumable chunks when given); engine="loop" is the original pairwise loop.
+    ``workers`` > 1 spreads query rows over a process pool. ``dedupe=True`` scores
+    each distinct feature row once (see rfq_dedupe); the output is the same. It
+    runs in memory in one process with the numpy engine only, and raises
+    ValueError otherwise.
+    """
+    if dedupe and engine != "numpy":
+        raise ValueError(f"dedupe=True needs engine='numpy', not {engine!r}")
+    if engine == "numpy":
+        if dedupe:
+            import rfq_dedupe
+            rfq_engine.reject_options("dedupe=True", out_dir=out_dir, workers=workers,
+                                      col_block_size=col_block_size)
+            return rfq_dedupe.deduplicated_top_k(rfq_enriched, k=k, mode=mode, weights=weights,
+                                                 block_size=block_size)
+        if out_dir:
+            rfq_engine.stream_top_k(rfq_enriched, out_dir, k=k, mode=mode, weights=weights,
+                                    block_size=block_size or 1024,
+                                    col_block_size=col_block_size or 8192)
+            return rfq_engine.read_top_k_chunks(out_dir)
+        return rfq_engine.vectorized_top_k(rfq_enriched, k=k, mode=mode, weights=weights,
+                                           block_size=block_size, col_block_size=col_block_size,
+                                           workers=workers)
+    if engine != "loop":
+        raise ValueError(f"Unknown engine: {engine}")
+
     rfq_ids = rfq_enriched['id'].tolist()
     results = []
 
@@ -66,24 +101,116 @@ def ablation_similarity(rfq_enriched, mode="all", weights=None):
 
             similarities.append((id2, total_sim))
 
-        # keep top-3
-        similarities = sorted(similarities, key=lambda x: x[1], reverse=True)[:3]
+        # keep top-k
+        similarities = sorted(similarities, key=lambda x: x[1], reverse=True)[:k]
         for match_id, score in similarities:
             results.append({"rfq_id": id1, "match_id": match_id, "similarity_score": score})
 
     return pd.DataFrame(results)
 
+# ---------- shared-component runner ----------
+def compute_components(rfq_enriched, components_dir=None, block_size=None):
+    """Compute the N x N dimension, categorical and grade similarity matrices once.
+
+    With ``components_dir`` the matrices are stored as memory-mapped ``.npy`` files
+    and reused by later calls on the same RFQ book, so large N never has to fit in RAM.
+    The manifest holds the ids, a hash of the packed features and the stored
+    components, so edited features are rescored rather than read back stale.
+    Returns a dict with the packed features and the three matrices.
+    """
+    packed = rfq_engine.pack_features(rfq_enriched)
+    n = len(packed["ids"])
+    manifest = {"n_rows": n, "ids_sha1": rfq_engine.ids_fingerprint(packed),
+                "features_sha1": rfq_engine.features_fingerprint(packed),
+                "components": COMPONENTS, "dtype": np.dtype(np.float64).str}
+
+    if components_dir:
+        os.makedirs(components_dir, exist_ok=True)
+        manifest_path = os.path.join(components_dir, "manifest.json")
+        paths = {c: os.path.join(components_dir, f"{c}_sim.npy") for c in COMPONENTS}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f) == manifest:
+                    mats = {c: np.load(p, mmap_mode="r") for c, p in paths.items()}
+                    return {"packed": packed, **mats}
+            os.remove(manifest_path)
+        mats = {c: np.lib.format.open_memmap(p, mode="w+", dtype=np.float64, shape=(n, n))
+                for c, p in paths.items()}
+    else:
+        mats = {c: np.empty((n, n)) for c in COMPONENTS}
+
+    block_size = block_size or rfq_engine.default_block_size(n)
+    for lo in range(0, n, block_size):
+        rows = np.arange(lo, min(lo + block_size, n))
+        for c, block in zip(COMPONENTS, rfq_engine.component_scores(packed, rows)):
+            mats[c][rows] = block
+
+    if components_dir:
+        for mat in mats.values():
+            mat.flush()
+        # Written last so an interrupted run is never mistaken for a complete one
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+    return {"packed": packed, **mats}
+
+def config_label(mode="all", weights=None):
+    """Name of an ablation configuration, e.g. ``dimensions`` or ``dim0.5_cat0.25_grade0.25``."""
+    if weights is None:
+        return mode
+    return f"dim{weights['dim']}_cat{weights['cat']}_grade{weights['grade']}"
+
+def run_ablation(rfq_enriched, modes=("dimensions", "grade", "categorical", "all"), weight_grid=(),
+                 k=3, components=None, components_dir=None, block_size=None, dedupe=False):
+    """Top-k for every mode and every weights dict in ``weight_grid`` in a single pass.
+
+    Component scores are taken from ``components`` (see compute_components) or
+    computed once per row block, then combined for each configuration, so adding
+    configurations costs a weighted sum and a top-k rather than a full rescoring.
+    With ``dedupe=True`` each configuration is scored over the distinct feature
+    rows only (see rfq_dedupe) instead. Returns {config_label: DataFrame}.
+    """
+    configs = [(config_label(mode), mode, None) for mode in modes]
+    configs += [(config_label("all", w), "all", w) for w in weight_grid]
+    if dedupe:
+        import rfq_dedupe
+        packed = rfq_engine.pack_features(rfq_enriched)
+        rows = np.arange(len(packed["ids"]))
+        return {label: rfq_engine.top_k_frame(packed, rows,
+                                              *rfq_dedupe.packed_top_k(packed, k, mode, weights, block_size)[:2])
+                for label, mode, weights in configs}
+
+    if components is None and components_dir:
+        components = compute_components(rfq_enriched, components_dir, block_size)
+    packed = components["packed"] if components else rfq_engine.pack_features(rfq_enriched)
+    n = len(packed["ids"])
+    frames = {label: [] for label, _, _ in configs}
+
+    block_size = block_size or rfq_engine.default_block_size(n)
+    for lo in range(0, n, block_size):
+        rows = np.arange(lo, min(lo + block_size, n))
+        if components:
+            parts = [np.asarray(components[c][rows]) for c in COMPONENTS]
+        else:
+            parts = rfq_engine.component_scores(packed, rows)
+        is_self = packed["id_codes"][rows, None] == packed["id_codes"][None, :]
+        for label, mode, weights in configs:
+            scores = np.where(is_self, -np.inf, rfq_engine.combine_scores(*parts, mode=mode, weights=weights))
+            idx, vals = rfq_engine.top_k_rows(scores, k)
+            frames[label].append(rfq_engine.top_k_frame(packed, rows, idx, vals))
+
+    return {label: rfq_engine._concat_frames(parts) for label, parts in frames.items()}
+
 # ---------- main ----------
 if __name__ == "__main__":
-    input_path = "outputs/rfq_enriched.csv"
     output_dir = "outputs"
     os.makedirs(output_dir, exist_ok=True)
 
-    rfq_enriched = pd.read_csv(input_path)
+    # Typed enriched store from run.py (re-enriched only if the inputs changed)
+    rfq_enriched = rfq_store.load_or_enrich("data/rfq.csv", "data/reference_properties.tsv",
+                                            "outputs/rfq_enriched_store")
 
     modes = ["dimensions", "grade", "categorical", "all"]
-    for mode in modes:
-        df = ablation_similarity(rfq_enriched, mode=mode)
+    for mode, df in run_ablation(rfq_enriched, modes=modes).items():
         out_path = os.path.join(output_dir, f"top3_{mode}.csv")
         df.to_csv(out_path, index=False)
         print(f"[OK] Saved {out_path} with {len(df)} rows")
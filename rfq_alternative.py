@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csr_matrix
+import rfq_engine
+import rfq_store
 
 def jaccard_similarity(set1, set2):
     """Compute Jaccard similarity between two sets."""
@@ -10,11 +12,128 @@ def jaccard_similarity(set1, set2):
     union = len(set1.union(set2))
     return intersection / union if union > 0 else 0.0
 
-def compute_top3_cosine_jaccard(rfq_enriched, numeric_cols, cat_cols, weight_cosine=0.6, weight_jacc=0.4):
-    """Compute top-3 similar RFQs using cosine+jaccard hybrid metric."""
+def pack_hybrid_features(rfq_enriched, numeric_cols, cat_cols):
+    """Arrays for the hybrid metric: unit-norm numeric rows and a CSR one-hot of ``col:value`` features.
+
+    The one-hot matrix is kept as its ``indptr``/``indices`` arrays (all data are 1)
+    so the dict can be placed in shared memory as-is.
+    """
+    # Row L2 normalization as in sklearn.preprocessing.normalize, without importing sklearn
+    numeric = rfq_enriched[numeric_cols].fillna(0).to_numpy(dtype=np.float64)
+    norms = np.sqrt(np.einsum('ij,ij->i', numeric, numeric))
+    norms[norms == 0] = 1
+    numeric = numeric / norms[:, None]
+    n = len(rfq_enriched)
+    codes, offset = [], 0
+    for col in cat_cols:
+        col_codes, uniques = pd.factorize(rfq_enriched[col])
+        codes.append(np.where(col_codes >= 0, col_codes + offset, -1))
+        offset += len(uniques)
+    codes = np.column_stack(codes) if codes else np.empty((n, 0), dtype=np.int64)
+    present = codes >= 0
+    indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))]).astype(np.int64)
+    id_codes, _ = pd.factorize(rfq_enriched['id'])
+    return {
+        "numeric": numeric,
+        "cat_codes": codes.astype(np.int64),
+        "onehot_indptr": indptr,
+        "onehot_indices": codes[present].astype(np.int64),
+        "onehot_width": np.array([offset], dtype=np.int64),
+        "id_codes": id_codes.astype(np.int64),
+    }
+
+def _onehot_matrix(arrays):
+    indices = arrays["onehot_indices"]
+    shape = (len(arrays["id_codes"]), int(arrays["onehot_width"][0]))
+    return csr_matrix((np.ones(len(indices)), indices, arrays["onehot_indptr"]), shape=shape)
+
+def _hybrid_context(arrays):
+    onehot = _onehot_matrix(arrays)
+    return onehot, onehot.T.tocsr(), np.diff(arrays["onehot_indptr"])
+
+def hybrid_scores(arrays, rows, context, weight_cosine=0.6, weight_jacc=0.4):
+    """Cosine+Jaccard scores of query ``rows`` against every row (no self-exclusion).
+
+    Intersections come from the sparse product of the block's one-hot rows with
+    all rows, unions from ``|a| + |b| - intersection``.
+    """
+    numeric = arrays["numeric"]
+    onehot, onehot_t, present = context
+    # Feature-by-feature accumulation instead of a BLAS product keeps every score
+    # independent of the block shape, so block size and worker count never flip ties
+    cos_sim = np.zeros((len(rows), len(numeric)))
+    for f in range(numeric.shape[1]):
+        cos_sim += numeric[rows, f, None] * numeric[None, :, f]
+    inter = (onehot[rows] @ onehot_t).toarray()
+    union = present[rows, None] + present[None, :] - inter
+    with np.errstate(invalid='ignore', divide='ignore'):
+        jacc_sim = np.where(union > 0, inter / union, 1.0)
+    return weight_cosine * cos_sim + weight_jacc * jacc_sim
+
+def hybrid_top_k_range(arrays, start, stop, k=3, weight_cosine=0.6, weight_jacc=0.4, block_size=None):
+    """Top-k (indices, values) of the cosine+jaccard metric for query rows [start, stop).
+
+    Cosine and Jaccard are computed for one block of rows at a time (see
+    hybrid_scores). Neither the N x N cosine matrix nor per-row Python sets are built.
+    """
+    id_codes = arrays["id_codes"]
+    context = _hybrid_context(arrays)
+    n = len(id_codes)
+    block_size = block_size or rfq_engine.default_block_size(n)
+    idx_parts, val_parts = [], []
+    for lo in range(start, stop, block_size):
+        rows = np.arange(lo, min(lo + block_size, stop))
+        scores = hybrid_scores(arrays, rows, context, weight_cosine, weight_jacc)
+        scores[id_codes[rows, None] == id_codes[None, :]] = -np.inf
+        idx, vals = rfq_engine.top_k_rows(scores, k)
+        idx_parts.append(idx)
+        val_parts.append(vals)
+    if not idx_parts:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k))
+    return np.vstack(idx_parts), np.vstack(val_parts)
+
+def compute_top3_cosine_jaccard(rfq_enriched, numeric_cols, cat_cols, weight_cosine=0.6, weight_jacc=0.4,
+                                engine="sparse", workers=None, block_size=None, k=3, dedupe=False):
+    """Compute top-3 (or top-``k``) similar RFQs using cosine+jaccard hybrid metric.
+
+    engine="sparse" scores row blocks with a CSR one-hot Jaccard and blocked cosine
+    (``workers`` > 1 spreads the blocks over a process pool); engine="loop" is the
+    original implementation with a dense cosine matrix and per-row sets.
+    ``dedupe=True`` scores each distinct (normalized numeric, categorical) row
+    once (see rfq_dedupe); the output is the same. It runs in one process with
+    the sparse engine only, and raises ValueError otherwise.
+    """
+    if dedupe:
+        if engine != "sparse":
+            raise ValueError(f"dedupe=True needs engine='sparse', not {engine!r}")
+        rfq_engine.reject_options("dedupe=True", workers=workers)
+    if engine == "sparse":
+        arrays = pack_hybrid_features(rfq_enriched, numeric_cols, cat_cols)
+        options = dict(k=k, weight_cosine=weight_cosine, weight_jacc=weight_jacc, block_size=block_size)
+        if dedupe:
+            import rfq_dedupe
+            reps, inverse = rfq_dedupe.feature_groups(arrays["numeric"], arrays["cat_codes"])
+            unique = pack_hybrid_features(rfq_enriched.iloc[reps], numeric_cols, cat_cols)
+            context = _hybrid_context(unique)
+            idx, vals = rfq_dedupe.dedup_top_k(
+                lambda groups: hybrid_scores(unique, groups, context, weight_cosine, weight_jacc),
+                inverse, arrays["id_codes"], k, block_size)
+        elif workers and workers > 1:
+            import rfq_parallel
+            idx, vals = rfq_parallel.parallel_top_k(arrays, hybrid_top_k_range, len(rfq_enriched),
+                                                    workers, **options)
+        else:
+            idx, vals = hybrid_top_k_range(arrays, 0, len(rfq_enriched), **options)
+        return rfq_engine.top_k_frame({"ids": rfq_enriched['id'].to_numpy()},
+                                      np.arange(len(rfq_enriched)), idx, vals)
+    if engine != "loop":
+        raise ValueError(f"Unknown engine: {engine}")
+
     rfq_ids = rfq_enriched['id'].tolist()
     results = []
 
+    from sklearn.metrics.pairwise import cosine_similarity
+
     # Prepare numeric matrix for cosine similarity
     numeric_data = rfq_enriched[numeric_cols].fillna(0).to_numpy()
     cos_sim_matrix = cosine_similarity(numeric_data)
@@ -46,8 +165,8 @@ def compute_top3_cosine_jaccard(rfq_enriched, numeric_cols, cat_cols, weight_cos
             total_sim = weight_cosine * cos_sim + weight_jacc * jacc_sim
             similarities.append((id2, total_sim))
 
-        # Top 3 matches
-        similarities = sorted(similarities, key=lambda x: x[1], reverse=True)[:3]
+        # Top k matches
+        similarities = sorted(similarities, key=lambda x: x[1], reverse=True)[:k]
         for match_id, score in similarities:
             results.append({'rfq_id': id1, 'match_id': match_id, 'similarity_score': score})
 
@@ -55,11 +174,11 @@ def compute_top3_cosine_jaccard(rfq_enriched, numeric_cols, cat_cols, weight_cos
 
 if __name__ == "__main__":
     # Paths
-    enriched_path = "outputs/rfq_enriched.csv"
     output_path = "outputs/top3_cosine_jaccard.csv"
 
-    # Load enriched RFQ
-    rfq_enriched = pd.read_csv(enriched_path)
+    # Load enriched RFQ (typed store from run.py, re-enriched only if the inputs changed)
+    rfq_enriched = rfq_store.load_or_enrich("data/rfq.csv", "data/reference_properties.tsv",
+                                            "outputs/rfq_enriched_store")
 
     # Numeric and categorical columns
     numeric_cols = [
@@ -1,41 +1,41 @@
 # rfq_clustering.py
+import argparse
+import os
 import pandas as pd
 import numpy as np
+import joblib
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
-from sklearn.cluster import KMeans
-
-def cluster_rfq(rfq_enriched, n_clusters=5):
-    """Cluster RFQs using numeric + categorical features."""
-
-    # -------------------------
-    # 1. Select features
-    # -------------------------
-    numeric_features = [
-        "thickness_min", "thickness_max",
-        "width_min", "width_max",
-        "length_min", "length_max",
-        "height_min", "height_max",
-        "weight_min", "weight_max",
-        "inner_diameter_min", "inner_diameter_max",
-        "outer_diameter_min", "outer_diameter_max",
-        "tensile_mid", "yield_mid",
-        "elongation_mid", "reduction_mid", "hardness_mid"
-    ]
-
-    categorical_features = [
-        "coating", "finish", "form",
-        "surface_type", "surface_protection"
-    ]
-
-    # Keep only relevant columns
-    rfq_filtered = rfq_enriched[numeric_features + categorical_features].copy()
-
-    # -------------------------
-    # 2. Preprocessing pipelines
-    # -------------------------
+from sklearn.cluster import KMeans, MiniBatchKMeans
+import rfq_store
+
+NUMERIC_FEATURES = [
+    "thickness_min", "thickness_max",
+    "width_min", "width_max",
+    "length_min", "length_max",
+    "height_min", "height_max",
+    "weight_min", "weight_max",
+    "inner_diameter_min", "inner_diameter_max",
+    "outer_diameter_min", "outer_diameter_max",
+    "tensile_mid", "yield_mid",
+    "elongation_mid", "reduction_mid", "hardness_mid"
+]
+
+CATEGORICAL_FEATURES = [
+    "coating", "finish", "form",
+    "surface_type", "surface_protection"
+]
+
+# Rows transformed and fed to MiniBatchKMeans.partial_fit at once
+CHUNK_SIZE = 10000
+
+def build_preprocessor(sparse=False):
+    """Impute/scale numeric features and one-hot categoricals.
+
+    ``sparse=True`` always returns a CSR matrix instead of densifying the one-hot block.
+    """
     numeric_transformer = Pipeline(steps=[
         ("imputer", SimpleImputer(strategy="mean")),
         ("scaler", StandardScaler())
@@ -46,46 +46,124 @@ def cluster_rfq(rfq_enriched, n_clusters=5):
         ("onehot", OneHotEncoder(handle_unknown="ignore"))
     ])
 
-    preprocessor = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
-            ("num", numeric_transformer, numeric_features),
-            ("cat", categorical_transformer, categorical_features)
-        ]
+            ("num", numeric_transformer, NUMERIC_FEATURES),
+            ("cat", categorical_transformer, CATEGORICAL_FEATURES)
+        ],
+        sparse_threshold=1.0 if sparse else 0.3
     )
 
-    # -------------------------
-    # 3. Fit KMeans clustering
-    # -------------------------
-    model = Pipeline(steps=[
-        ("preprocessor", preprocessor),
-        ("clusterer", KMeans(n_clusters=n_clusters, random_state=42, n_init=10))
-    ])
+def _chunks(n, chunk_size):
+    for start in range(0, n, chunk_size):
+        yield slice(start, min(start + chunk_size, n))
+
+def cluster_rfq(rfq_enriched, n_clusters=5, mode="kmeans", chunk_size=CHUNK_SIZE, n_passes=1, model_path=None):
+    """Cluster RFQs using numeric + categorical features.
 
-    rfq_filtered["cluster"] = model.fit_predict(rfq_filtered)
+    ``mode="minibatch"`` is the large-data path: the preprocessor is fit once on the
+    whole frame (means, scales and category lists only), then MiniBatchKMeans is
+    trained with ``partial_fit`` over shuffled chunks of sparse features, so the full
+    dense design matrix is never built. ``model_path`` saves the fitted pipeline.
+    """
 
+    # Keep only relevant columns
+    rfq_filtered = rfq_enriched[NUMERIC_FEATURES + CATEGORICAL_FEATURES].copy()
+
+    if mode == "kmeans":
+        model = Pipeline(steps=[
+            ("preprocessor", build_preprocessor()),
+            ("clusterer", KMeans(n_clusters=n_clusters, random_state=42, n_init=10))
+        ])
+        rfq_filtered["cluster"] = model.fit_predict(rfq_filtered)
+    elif mode == "minibatch":
+        preprocessor = build_preprocessor(sparse=True).fit(rfq_filtered)
+        clusterer = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=min(chunk_size, 4096))
+        order = np.random.default_rng(42).permutation(len(rfq_filtered))
+        for _ in range(n_passes):
+            for part in _chunks(len(order), chunk_size):
+                clusterer.partial_fit(preprocessor.transform(rfq_filtered.iloc[order[part]]))
+        model = Pipeline(steps=[("preprocessor", preprocessor), ("clusterer", clusterer)])
+        rfq_filtered["cluster"] = predict_clusters(rfq_filtered, model, chunk_size)
+    else:
+        raise ValueError(f"Unknown clustering mode: {mode}")
+
+    if model_path:
+        save_model(model, model_path)
     return rfq_filtered, model
 
+def predict_clusters(rfq_enriched, model, chunk_size=CHUNK_SIZE):
+    """Cluster labels from a fitted pipeline, transformed chunk by chunk."""
+    features = rfq_enriched[NUMERIC_FEATURES + CATEGORICAL_FEATURES]
+    labels = np.empty(len(features), dtype=np.int32)
+    for part in _chunks(len(features), chunk_size):
+        labels[part] = model.predict(features.iloc[part])
+    return labels
+
+def assign_clusters(rfq_new, model, chunk_size=CHUNK_SIZE):
+    """Assign new RFQs to the clusters of an already fitted pipeline, without refitting.
+
+    Categories unseen at fit time are ignored by the encoder.
+    """
+    if isinstance(model, (str, os.PathLike)):
+        model = load_model(model)
+    rfq_filtered = rfq_new[NUMERIC_FEATURES + CATEGORICAL_FEATURES].copy()
+    rfq_filtered["cluster"] = predict_clusters(rfq_filtered, model, chunk_size)
+    return rfq_filtered
+
+def save_model(model, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    joblib.dump(model, path)
+
+def load_model(path):
+    return joblib.load(path)
+
 
 def cluster_summary(rfq_filtered):
-    """Summarize clusters by numeric means and categorical modes."""
-    summary = {}
-    for cluster_id, group in rfq_filtered.groupby("cluster"):
-        numeric_means = group.select_dtypes(include=[np.number]).mean()
-        categorical_modes = group.select_dtypes(exclude=[np.number]).mode().iloc[0]
-        summary[cluster_id] = pd.concat([numeric_means, categorical_modes])
-    return pd.DataFrame(summary).T
+    """Summarize clusters by numeric means and categorical modes.
+
+    Means are taken per group with ``DataFrame.mean``, which sums differently from
+    ``groupby().mean()`` and so keeps the last bit of each mean. Modes are one
+    grouped count per column; ties go to the smallest value, as with ``DataFrame.mode``.
+    """
+    numeric_cols = rfq_filtered.select_dtypes(include=[np.number]).columns
+    categorical_cols = rfq_filtered.select_dtypes(exclude=[np.number]).columns
+    # Plain array keys, so "cluster" itself stays among the numeric means
+    clusters = rfq_filtered["cluster"].to_numpy()
+
+    summary = pd.DataFrame({cluster_id: group.mean()
+                            for cluster_id, group in rfq_filtered[numeric_cols].groupby(clusters)}).T
+    for col in categorical_cols:
+        counts = rfq_filtered.groupby([clusters, rfq_filtered[col]]).size().rename("n").reset_index(level=1)
+        counts = counts.sort_values("n", ascending=False, kind="stable")
+        summary[col] = counts[~counts.index.duplicated()][col]
+    summary.index = pd.Index(summary.index.tolist())
+    return summary.astype(object)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster RFQs into families.")
+    parser.add_argument("--mode", choices=["kmeans", "minibatch"], default="kmeans")
+    parser.add_argument("--n-clusters", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--model", default=None, help="save the fitted pipeline here (joblib)")
+    parser.add_argument("--assign", default=None,
+                        help="assign the RFQs with the pipeline saved at this path instead of fitting")
+    args = parser.parse_args()
+
     # Paths
-    rfq_path = "outputs/rfq_enriched.csv"
     clustered_path = "outputs/rfq_clustered.csv"
 
-    # Load enriched data
-    rfq_enriched = pd.read_csv(rfq_path)
+    # Load enriched data (typed store from run.py, re-enriched only if the inputs changed)
+    rfq_enriched = rfq_store.load_or_enrich("data/rfq.csv", "data/reference_properties.tsv",
+                                            "outputs/rfq_enriched_store")
 
     # Cluster
-    clustered, model = cluster_rfq(rfq_enriched, n_clusters=5)
+    if args.assign:
+        clustered = assign_clusters(rfq_enriched, args.assign, args.chunk_size)
+    else:
+        clustered, model = cluster_rfq(rfq_enriched, n_clusters=args.n_clusters, mode=args.mode,
+                                       chunk_size=args.chunk_size, model_path=args.model)
 
     # Save clustered RFQs with cluster labels
     clustered.to_csv(clustered_path, index=False)
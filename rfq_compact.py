@@ -0,0 +1,61 @@
+# rfq_compact.py
+import pandas as pd
+import numpy as np
+import rfq_engine
+
+# Columns the similarity and matching stages read; everything else is dropped
+RFQ_SCORING_COLUMNS = (
+    ['id', 'grade']
+    + [f"{dim}_{side}" for dim in rfq_engine.DIM_COLS for side in ('min', 'max')]
+    + rfq_engine.CAT_COLS
+    + rfq_engine.GRADE_MID_COLS
+)
+INVENTORY_SCORING_COLUMNS = [
+    "article_id", "source", "grade", "coating", "finish",
+    "thickness_mm", "width_mm", "weight_kg", "rp02", "rm", "reserved"
+]
+# Text columns encoded against one vocabulary shared by every frame that has them
+VOCAB_COLUMNS = ['grade', 'source'] + rfq_engine.CAT_COLS
+# Numerics that float32 cannot hold exactly (8-digit article numbers) stay float64
+FLOAT64_COLUMNS = ["article_id"]
+
+# ---------- vocabulary ----------
+def build_vocabulary(*frames, columns=VOCAB_COLUMNS):
+    """Sorted categories per column over all given frames, so codes agree across them."""
+    vocab = {}
+    for col in columns:
+        values = [f[col].dropna().astype(str).unique() for f in frames if col in f.columns]
+        if values:
+            vocab[col] = pd.Index(np.unique(np.concatenate(values)))
+    return vocab
+
+# ---------- compaction ----------
+def compact_frame(df, columns, vocab=None, float_dtype=np.float32):
+    """Keep ``columns`` (those present), as categoricals and ``float_dtype`` numerics.
+
+    Text columns in ``vocab`` become ``pd.Categorical`` with the shared categories
+    (integer codes, -1 for missing); other text columns are left as they are.
+    """
+    vocab = build_vocabulary(df) if vocab is None else vocab
+    out = {}
+    for col in [c for c in columns if c in df.columns]:
+        series = df[col]
+        if col in vocab:
+            out[col] = pd.Categorical(series.astype("string"), categories=vocab[col])
+        elif pd.api.types.is_numeric_dtype(series) and col not in FLOAT64_COLUMNS:
+            out[col] = series.to_numpy(dtype=float_dtype)
+        else:
+            out[col] = series
+    return pd.DataFrame(out, index=df.index)
+
+def compact_enriched(rfq_enriched, vocab=None, float_dtype=np.float32):
+    """Scoring-only view of an enriched RFQ frame (see RFQ_SCORING_COLUMNS)."""
+    return compact_frame(rfq_enriched, RFQ_SCORING_COLUMNS, vocab, float_dtype)
+
+def compact_inventory(inventory, vocab=None, float_dtype=np.float32):
+    """Matching-only view of the cleaned inventory (see INVENTORY_SCORING_COLUMNS)."""
+    return compact_frame(inventory, INVENTORY_SCORING_COLUMNS, vocab, float_dtype)
+
+def frame_memory_mb(df):
+    """Deep memory usage of a frame, in MB."""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
@@ -0,0 +1,107 @@
+# rfq_dedupe.py
+import numpy as np
+import rfq_engine
+
+# ---------- grouping ----------
+def feature_groups(*arrays):
+    """Group rows whose feature arrays are identical.
+
+    Rows are compared on the bits of every column of ``arrays`` (2-D, one row per
+    RFQ), so missing values group together. Returns (representatives, inverse):
+    the first row of each group in row order, and each row's group.
+    """
+    columns = [np.ascontiguousarray(a).view(f"i{a.itemsize}").reshape(len(a), -1).astype(np.int64)
+               for a in arrays]
+    _, first, inverse = np.unique(np.hstack(columns), axis=0, return_index=True, return_inverse=True)
+    # Number groups by first occurrence, so representatives keep the row order
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()]
+
+def group_stats(inverse):
+    """Rows, unique feature rows and their ratio; pairs shrink by about the ratio squared."""
+    rows, unique = len(inverse), int(inverse.max()) + 1 if len(inverse) else 0
+    return {"rows": rows, "unique": unique, "unique_ratio": unique / rows if rows else 1.0}
+
+def _ranges(starts, counts):
+    """Concatenated ``arange(start, start + count)`` for each pair."""
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - offsets
+
+# ---------- top-k over groups ----------
+def dedup_top_k(score_groups, inverse, id_codes, k=3, block_size=None):
+    """Per-row top-k (indices, values) from scores between groups of identical rows.
+
+    ``score_groups(group_rows)`` returns the (len(group_rows), n_groups) scores of
+    those groups' representatives against every representative. Rows of one group
+    score alike, so a row's top-k lies within the best groups. Enough groups are
+    kept to hold k matches plus the largest number of rows one id can exclude,
+    and groups tied with the last one are kept too. Those groups are expanded to
+    their first rows, and each query row drops the rows with its own id. The rest is
+    ranked by (-score, row) as in ``rfq_engine.top_k_rows``, so the output equals
+    the brute-force result.
+    """
+    n = len(inverse)
+    idx_out = np.full((n, k), -1, dtype=np.int64)
+    val_out = np.full((n, k), -np.inf)
+    if n == 0 or k <= 0:
+        return idx_out, val_out
+    n_groups = int(inverse.max()) + 1
+    members = np.argsort(inverse, kind='stable')
+    sizes = np.bincount(inverse, minlength=n_groups)
+    starts = np.cumsum(sizes) - sizes
+    # np.unique, not bincount: a missing id has the factorize code -1
+    need = min(n_groups, k + int(np.unique(id_codes, return_counts=True)[1].max()))
+
+    block_size = block_size or rfq_engine.default_block_size(n_groups)
+    for lo in range(0, n_groups, block_size):
+        groups = np.arange(lo, min(lo + block_size, n_groups))
+        scores = score_groups(groups)
+        kth = -np.partition(-scores, need - 1, axis=1)[:, need - 1]
+        q, h = np.nonzero(scores >= kth[:, None])
+
+        # Candidate rows of each query group, grouped by query group. Within a group
+        # only its first ``need`` rows can rank, whatever the exclusions
+        take = np.minimum(sizes[h], need)
+        cand_q = np.repeat(q, take)
+        cand_rows, cand_vals = members[_ranges(starts[h], take)], np.repeat(scores[q, h], take)
+        cand_count = np.bincount(cand_q, minlength=len(groups))
+        cand_start = np.cumsum(cand_count) - cand_count
+
+        # Every member row of a query group takes that group's candidates
+        query_rows = members[_ranges(starts[groups], sizes[groups])]
+        query_q = np.repeat(np.arange(len(groups)), sizes[groups])
+        pick = _ranges(cand_start[query_q], cand_count[query_q])
+        rows = np.repeat(query_rows, cand_count[query_q])
+        cols, vals = cand_rows[pick], cand_vals[pick]
+        keep = (id_codes[rows] != id_codes[cols]) & (vals > -np.inf)
+        rows, cols, vals = rows[keep], cols[keep], vals[keep]
+
+        order = np.lexsort((cols, -vals, rows))
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side='left')
+        top = rank < k
+        idx_out[rows[top], rank[top]] = cols[top]
+        val_out[rows[top], rank[top]] = vals[top]
+    return idx_out, val_out
+
+def packed_top_k(packed, k=3, mode="all", weights=None, block_size=None):
+    """Deduplicated ``rfq_engine`` top-k for packed features; returns (indices, values, stats)."""
+    reps, inverse = feature_groups(*(packed[key] for key in rfq_engine.FEATURE_KEYS))
+    unique = {key: packed[key][reps] for key in rfq_engine.FEATURE_KEYS}
+    score_groups = lambda groups: rfq_engine.combine_scores(*rfq_engine.component_scores(unique, groups),
+                                                            mode=mode, weights=weights)
+    idx, vals = dedup_top_k(score_groups, inverse, packed["id_codes"], k, block_size)
+    return idx, vals, group_stats(inverse)
+
+def deduplicated_top_k(rfq_enriched, k=3, mode="all", weights=None, block_size=None, return_stats=False):
+    """Top-k similarity scoring only distinct feature rows; same output as ``vectorized_top_k``.
+
+    With ``return_stats`` also returns the row count, the distinct feature rows
+    and the unique-to-total ratio.
+    """
+    packed = rfq_engine.pack_features(rfq_enriched)
+    idx, vals, stats = packed_top_k(packed, k, mode, weights, block_size)
+    result = rfq_engine.top_k_frame(packed, np.arange(len(packed["ids"])), idx, vals)
+    return (result, stats) if return_stats else result
@@ -0,0 +1,548 @@
+# rfq_engine.py
+import pandas as pd
+import numpy as np
+import glob
+import hashlib
+import json
+import os
+
+# ---------- feature definitions ----------
+DIM_COLS = ['thickness', 'width', 'length', 'height', 'weight', 'inner_diameter', 'outer_diameter']
+CAT_COLS = ['coating', 'finish', 'form', 'surface_type', 'surface_protection']
+GRADE_MID_COLS = ['tensile_mid', 'yield_mid', 'elongation_mid', 'reduction_mid', 'hardness_mid']
+DEFAULT_WEIGHTS = {"dim": 0.4, "cat": 0.3, "grade": 0.3}
+
+# Score budget (number of float64 cells) for one block of query rows
+BLOCK_CELLS = 2_000_000
+# Smallest positive value per float dtype (see score_query)
+_TINY = {np.dtype(np.float64): np.finfo(np.float64).smallest_subnormal,
+         np.dtype(np.float32): np.finfo(np.float32).smallest_subnormal}
+
+# ---------- packing ----------
+def _numeric_matrix(rfq_enriched, cols, dtype=np.float64):
+    """Stack numeric columns into an (N, len(cols)) array; missing columns become NaN."""
+    n = len(rfq_enriched)
+    out = np.full((n, len(cols)), np.nan, dtype=dtype)
+    for c, col in enumerate(cols):
+        if col in rfq_enriched.columns:
+            out[:, c] = pd.to_numeric(rfq_enriched[col], errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+    return out
+
+def _float_dtype(rfq_enriched, cols):
+    """float32 when every present scoring column already is (a compact frame), else float64."""
+    present = [rfq_enriched[col].dtype for col in cols if col in rfq_enriched.columns]
+    return np.float32 if present and all(d == np.float32 for d in present) else np.float64
+
+def pack_features(rfq_enriched):
+    """Pack the scoring columns of an enriched RFQ frame into NumPy arrays.
+
+    Categoricals become integer codes where -1 marks a missing value (never equal,
+    like NaN in the row loop). A column absent from the frame is coded 0 for every
+    row, matching the loop where ``None == None``. Categorical columns (see
+    ``rfq_compact``) reuse their codes instead of hashing strings, and a frame whose
+    scoring columns are all float32 is packed and scored in float32.
+    """
+    ids = rfq_enriched['id'].to_numpy()
+    id_codes, _ = pd.factorize(rfq_enriched['id'])
+
+    cat_codes = np.zeros((len(rfq_enriched), len(CAT_COLS)), dtype=np.int64)
+    for c, col in enumerate(CAT_COLS):
+        if col not in rfq_enriched.columns:
+            continue
+        if isinstance(rfq_enriched[col].dtype, pd.CategoricalDtype):
+            cat_codes[:, c] = rfq_enriched[col].cat.codes.to_numpy()
+        else:
+            cat_codes[:, c], _ = pd.factorize(rfq_enriched[col])
+
+    dim_min_cols = [f"{dim}_min" for dim in DIM_COLS]
+    dim_max_cols = [f"{dim}_max" for dim in DIM_COLS]
+    dtype = _float_dtype(rfq_enriched, dim_min_cols + dim_max_cols + GRADE_MID_COLS)
+    return {
+        "ids": ids,
+        "id_codes": id_codes.astype(np.int64),
+        "dim_min": _numeric_matrix(rfq_enriched, dim_min_cols, dtype),
+        "dim_max": _numeric_matrix(rfq_enriched, dim_max_cols, dtype),
+        "cat_codes": cat_codes,
+        "grade_mid": _numeric_matrix(rfq_enriched, GRADE_MID_COLS, dtype),
+    }
+
+# ---------- component similarities ----------
+FEATURE_KEYS = ["dim_min", "dim_max", "cat_codes", "grade_mid"]
+
+def _take(packed, key, cols):
+    arr = packed[key]
+    return arr if cols is None else arr[cols]
+
+def _dim_terms(q, c):
+    """Mean normalized interval overlap of broadcastable ``q``/``c`` feature arrays."""
+    dim_sim = None
+    for d in range(q["dim_min"].shape[-1]):
+        min1, max1 = q["dim_min"][..., d], q["dim_max"][..., d]
+        min2, max2 = c["dim_min"][..., d], c["dim_max"][..., d]
+        overlap = np.maximum(0, np.minimum(max1, max2) - np.maximum(min1, min2))
+        total = np.maximum(max1, max2) - np.minimum(min1, min2)
+        ratio = np.where(total > 0, overlap / total, 0.0)
+        dim_sim = ratio if dim_sim is None else dim_sim + ratio
+    dim_sim /= q["dim_min"].shape[-1]
+    return dim_sim
+
+def _cat_terms(q, c, dtype):
+    """Share of matching categorical codes; a missing code (-1) never matches."""
+    cat_sim = None
+    for col in range(q["cat_codes"].shape[-1]):
+        qcat = q["cat_codes"][..., col]
+        match = (qcat == c["cat_codes"][..., col]) & (qcat >= 0)
+        cat_sim = match.astype(dtype) if cat_sim is None else cat_sim + match
+    cat_sim /= q["cat_codes"].shape[-1]
+    return cat_sim
+
+def _grade_terms(q, c):
+    """Mean of 1 - relative difference of grade midpoints, 0 when missing or non-positive."""
+    grade_sim = None
+    for g in range(q["grade_mid"].shape[-1]):
+        v1, v2 = q["grade_mid"][..., g], c["grade_mid"][..., g]
+        vmax = np.maximum(v1, v2)
+        sim = np.where(vmax > 0, 1 - np.abs(v1 - v2) / vmax, 0.0)
+        grade_sim = sim if grade_sim is None else grade_sim + sim
+    grade_sim /= q["grade_mid"].shape[-1]
+    return grade_sim
+
+def component_scores(packed, rows, cols=None):
+    """Dimension, categorical and grade similarity of query ``rows`` against ``cols``.
+
+    Returns three (len(rows), len(cols)) arrays in the packed float dtype. The
+    arithmetic follows the scalar loop term by term so float64 scores are
+    bit-identical to ``interval_overlap``/``np.mean``.
+    """
+    q = {key: packed[key][rows][:, None, :] for key in FEATURE_KEYS}
+    c = {key: _take(packed, key, cols)[None, :, :] for key in FEATURE_KEYS}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _dim_terms(q, c), _cat_terms(q, c, packed["grade_mid"].dtype), _grade_terms(q, c)
+
+def pair_component_scores(packed, rows, cols):
+    """component_scores for the pairs (rows[i], cols[i]) only; 1-D arrays, same arithmetic."""
+    q = {key: packed[key][rows] for key in FEATURE_KEYS}
+    c = {key: packed[key][cols] for key in FEATURE_KEYS}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _dim_terms(q, c), _cat_terms(q, c, packed["grade_mid"].dtype), _grade_terms(q, c)
+
+def _add_rows(acc, rows, values):
+    """acc[rows] += values, in place when ``rows`` covers every row of ``acc``."""
+    if len(rows) == len(acc):
+        acc += values
+    else:
+        acc[rows] += values
+
+def score_query(query, packed, mode="all", weights=None, cols=None):
+    """Combined scores of query rows against the packed rows ``cols`` (a slice, default all).
+
+    ``query`` holds ``dim_min``/``dim_max``/``cat_codes``/``grade_mid`` in the packed
+    float dtype, 1-D for one row (1-D scores) or (b, terms) for a batch ((b, n)
+    scores). The arithmetic is that of component_scores, done in place on a few
+    reused buffers. Terms every query leaves missing contribute exactly 0 there,
+    so they are skipped, which keeps a sparse query cheap on a large corpus.
+    Column-major (Fortran-ordered) packed arrays make every column read contiguous.
+    """
+    single = np.ndim(query["dim_min"]) == 1
+    q = {key: np.atleast_2d(query[key]) for key in FEATURE_KEYS}
+    cols = slice(None) if cols is None else cols
+    n = len(packed["dim_min"][cols])
+    dtype = packed["grade_mid"].dtype
+    shape = (len(q["dim_min"]), n)
+    dim_sim, cat_sim, grade_sim = (np.zeros(shape, dtype=dtype) for _ in range(3))
+    buf1, buf2, buf3 = (np.empty(shape, dtype=dtype) for _ in range(3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for d in range(q["dim_min"].shape[1]):
+            # Only the queries that carry this term; the rest would add exactly 0
+            sub = np.flatnonzero(~(np.isnan(q["dim_min"][:, d]) | np.isnan(q["dim_max"][:, d])))
+            if not len(sub):
+                continue
+            b1, b2, b3 = buf1[:len(sub)], buf2[:len(sub)], buf3[:len(sub)]
+            min1, max1 = q["dim_min"][sub, d, None], q["dim_max"][sub, d, None]
+            min2, max2 = packed["dim_min"][cols, d], packed["dim_max"][cols, d]
+            # overlap = max(0, min(max1, max2) - max(min1, min2)), NaN (missing bound) -> 0
+            np.subtract(np.minimum(max1, max2, out=b1), np.maximum(min1, min2, out=b2), out=b1)
+            np.fmax(np.maximum(0, b1, out=b1), 0, out=b1)
+            # total = max(max1, max2) - min(min1, min2). Raising a zero or NaN total to the
+            # smallest subnormal leaves every total > 0 as is and turns the other ratios
+            # into 0/tiny = 0, the value of the masked branch, without a masked add.
+            np.subtract(np.maximum(max1, max2, out=b2), np.minimum(min1, min2, out=b3), out=b2)
+            np.fmax(b2, _TINY[dtype], out=b2)
+            _add_rows(dim_sim, sub, np.divide(b1, b2, out=b1))
+        dim_sim /= q["dim_min"].shape[1]
+
+        for c in range(q["cat_codes"].shape[1]):
+            # A missing query value (-1) never matches, not even missing corpus values
+            sub = np.flatnonzero(q["cat_codes"][:, c] >= 0)
+            if not len(sub):
+                continue
+            _add_rows(cat_sim, sub, packed["cat_codes"][cols, c] == q["cat_codes"][sub, c, None])
+        cat_sim /= q["cat_codes"].shape[1]
+
+        for g in range(q["grade_mid"].shape[1]):
+            sub = np.flatnonzero(~np.isnan(q["grade_mid"][:, g]))
+            if not len(sub):
+                continue
+            b1, b2 = buf1[:len(sub)], buf2[:len(sub)]
+            v1, v2 = q["grade_mid"][sub, g, None], packed["grade_mid"][cols, g]
+            # 1 - |v1 - v2| / max(v1, v2), counted only where the max is positive
+            np.abs(np.subtract(v1, v2, out=b1), out=b1)
+            if np.all(v1 > 0) and not (v2 < 0).any():
+                # Only a missing v2 fails max > 0 here, and every other ratio is <= 1,
+                # so clamping NaN ratios to 1 adds exactly the masked branch's 0
+                np.divide(b1, np.fmax(v1, v2, out=b2), out=b1)
+                _add_rows(grade_sim, sub, np.subtract(1, np.fmin(b1, 1, out=b1), out=b1))
+                continue
+            np.maximum(v1, v2, out=b2)
+            np.divide(b1, b2, out=b1)
+            np.subtract(1, b1, out=b1)
+            b1[~(b2 > 0)] = 0
+            _add_rows(grade_sim, sub, b1)
+        grade_sim /= q["grade_mid"].shape[1]
+
+    if mode != "all":
+        scores = combine_scores(dim_sim, cat_sim, grade_sim, mode=mode, weights=weights)
+    else:
+        # combine_scores' weighted sum, in place
+        w = weights if weights else DEFAULT_WEIGHTS
+        dim_sim *= w["dim"]
+        cat_sim *= w["cat"]
+        dim_sim += cat_sim
+        grade_sim *= w["grade"]
+        dim_sim += grade_sim
+        scores = dim_sim
+    return scores[0] if single else scores
+
+def combine_scores(dim_sim, cat_sim, grade_sim, mode="all", weights=None):
+    """Combine component scores the same way as ``ablation_similarity``."""
+    if mode == "dimensions":
+        return dim_sim
+    if mode == "grade":
+        return grade_sim
+    if mode == "categorical":
+        return cat_sim
+    w = weights if weights else DEFAULT_WEIGHTS
+    return w["dim"]*dim_sim + w["cat"]*cat_sim + w["grade"]*grade_sim
+
+# ---------- top-k ----------
+def top_k_rows(scores, k, cols=None):
+    """Per-row top-k of a score block, ties broken by ascending column.
+
+    ``-inf`` marks excluded cells. Returns (indices, values) of shape (rows, k),
+    padded with -1 / -inf where a row has fewer than k candidates.
+    ``cols`` maps block columns to global indices for tie-breaking: either one
+    index per column or, when merging running results, one row of indices per row.
+    """
+    n_rows, n_cols = scores.shape
+    idx_out = np.full((n_rows, k), -1, dtype=np.int64)
+    val_out = np.full((n_rows, k), -np.inf)
+    if n_rows == 0 or n_cols == 0 or k <= 0:
+        return idx_out, val_out
+
+    # k-th largest per row via argpartition, then keep everything tied with it
+    kk = min(k, n_cols)
+    part = np.argpartition(-scores, kk - 1, axis=1)[:, kk - 1]
+    kth = scores[np.arange(n_rows), part]
+    rows, pos = np.nonzero((scores >= kth[:, None]) & (scores > -np.inf))
+    vals = scores[rows, pos]
+    if cols is None:
+        gcols = pos
+    else:
+        cols = np.asarray(cols)
+        gcols = cols[pos] if cols.ndim == 1 else cols[rows, pos]
+
+    order = np.lexsort((gcols, -vals, rows))
+    rows, gcols, vals = rows[order], gcols[order], vals[order]
+    starts = np.searchsorted(rows, rows, side='left')
+    rank = np.arange(len(rows)) - starts
+    keep = rank < k
+    idx_out[rows[keep], rank[keep]] = gcols[keep]
+    val_out[rows[keep], rank[keep]] = vals[keep]
+    return idx_out, val_out
+
+def merge_top_k(idx_a, val_a, idx_b, val_b, k):
+    """Merge two running top-k lists row by row (same tie-breaking as top_k_rows)."""
+    return top_k_rows(np.hstack([val_a, val_b]), k, cols=np.hstack([idx_a, idx_b]))
+
+def reject_options(engine, **options):
+    """Raise ValueError for options ``engine`` does not support, instead of ignoring them.
+
+    An option counts when it is set; ``workers`` only above 1.
+    """
+    unsupported = [name for name, value in options.items() if value and not (name == "workers" and value <= 1)]
+    if unsupported:
+        raise ValueError(f"{engine} does not support {', '.join(unsupported)}")
+
+def default_block_size(n):
+    """Number of query rows per block so a score block stays within BLOCK_CELLS."""
+    return max(1, BLOCK_CELLS // max(n, 1))
+
+def _score_tile(packed, rows, cols, mode, weights):
+    scores = combine_scores(*component_scores(packed, rows, cols), mode=mode, weights=weights)
+    # Self-exclusion is by id, so duplicated ids never match each other
+    col_ids = packed["id_codes"] if cols is None else packed["id_codes"][cols]
+    scores[packed["id_codes"][rows, None] == col_ids[None, :]] = -np.inf
+    return scores
+
+def iter_top_k_blocks(packed, k=3, mode="all", weights=None, block_size=None,
+                      start=0, stop=None, col_block_size=None):
+    """Yield (rows, indices, values) for consecutive query blocks of the packed corpus.
+
+    With ``col_block_size`` the candidates are also tiled and each query row keeps a
+    running top-k, so peak memory is block_size x col_block_size instead of block_size x N.
+    """
+    n = len(packed["id_codes"])
+    stop = n if stop is None else stop
+    block_size = block_size or default_block_size(col_block_size or n)
+    for lo in range(start, stop, block_size):
+        rows = np.arange(lo, min(lo + block_size, stop))
+        if not col_block_size or col_block_size >= n:
+            idx, vals = top_k_rows(_score_tile(packed, rows, None, mode, weights), k)
+        else:
+            idx = np.full((len(rows), k), -1, dtype=np.int64)
+            vals = np.full((len(rows), k), -np.inf)
+            for clo in range(0, n, col_block_size):
+                cols = np.arange(clo, min(clo + col_block_size, n))
+                tile_idx, tile_vals = top_k_rows(_score_tile(packed, rows, cols, mode, weights), k, cols)
+                idx, vals = merge_top_k(idx, vals, tile_idx, tile_vals, k)
+        yield rows, idx, vals
+
+def top_k_range(packed, start, stop, k=3, mode="all", weights=None, block_size=None,
+                col_block_size=None):
+    """Top-k (indices, values) arrays for query rows [start, stop); used by pool workers."""
+    blocks = list(iter_top_k_blocks(packed, k, mode, weights, block_size, start, stop, col_block_size))
+    if not blocks:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k))
+    return np.vstack([b[1] for b in blocks]), np.vstack([b[2] for b in blocks])
+
+def top_k_frame(packed, rows, idx, vals):
+    """Flatten a top-k block into ``rfq_id, match_id, similarity_score`` records."""
+    valid = idx >= 0
+    q = np.repeat(rows, valid.sum(axis=1))
+    return pd.DataFrame({
+        'rfq_id': packed["ids"][q],
+        'match_id': packed["ids"][idx[valid]],
+        'similarity_score': vals[valid],
+    })
+
+def _concat_frames(frames):
+    if not frames:
+        return pd.DataFrame(columns=['rfq_id', 'match_id', 'similarity_score'])
+    return pd.concat(frames, ignore_index=True)
+
+def vectorized_top_k(rfq_enriched, k=3, mode="all", weights=None, block_size=None,
+                     col_block_size=None, workers=None):
+    """Block-wise NumPy top-k similarity; same output as the row loop.
+
+    ``workers`` > 1 splits query rows across a process pool (see rfq_parallel).
+    """
+    packed = pack_features(rfq_enriched)
+    if workers and workers > 1:
+        import rfq_parallel
+        arrays = {key: value for key, value in packed.items() if key != "ids"}
+        idx, vals = rfq_parallel.parallel_top_k(
+            arrays, top_k_range, len(packed["ids"]), workers,
+            k=k, mode=mode, weights=weights, block_size=block_size, col_block_size=col_block_size)
+        return top_k_frame(packed, np.arange(len(packed["ids"])), idx, vals)
+    return _concat_frames([
+        top_k_frame(packed, rows, idx, vals)
+        for rows, idx, vals in iter_top_k_blocks(packed, k, mode, weights, block_size,
+                                                 col_block_size=col_block_size)
+    ])
+
+# ---------- bound pruning ----------
+# Candidates per query row scored up front to set the pruning threshold
+PRUNE_SEEDS = 16
+# Largest number of distinct categorical / grade-midpoint rows scored through a lookup table
+PROFILE_TABLE_MAX = 4096
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << len(DIM_COLS))], dtype=np.int64)
+
+def dim_presence_mask(packed):
+    """Per-row bitmask of the dimensions whose two bounds are both present."""
+    present = ~(np.isnan(packed["dim_min"]) | np.isnan(packed["dim_max"]))
+    return (present << np.arange(present.shape[1])).sum(axis=1)
+
+def _lookup_table(packed, key, terms, *args):
+    """(codes, table) with ``table[codes[i], codes[j]]`` = ``terms`` of rows i and j, or None.
+
+    Rows are matched on their bits, so missing values group too. ``terms`` runs
+    on the distinct rows only, with the same arithmetic as on the full arrays.
+    """
+    values = packed[key]
+    unique, codes = np.unique(values.view(f"i{values.itemsize}"), axis=0, return_inverse=True)
+    if len(unique) > PROFILE_TABLE_MAX:
+        return None
+    unique = unique.view(values.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table = terms({key: unique[:, None, :]}, {key: unique[None, :, :]}, *args)
+    return codes.ravel(), table
+
+def component_tables(packed):
+    """Lookup tables for the categorical and grade scores (see _lookup_table).
+
+    Categoricals and grade midpoints (taken from the reference table) form few
+    distinct rows in a book, so their scores for any pair are a table lookup.
+    """
+    return (_lookup_table(packed, "cat_codes", _cat_terms, packed["grade_mid"].dtype),
+            _lookup_table(packed, "grade_mid", _grade_terms))
+
+def pruned_top_k_blocks(packed, k=3, mode="all", weights=None, block_size=None):
+    """Yield (rows, indices, values, scored pairs) with upper-bound pruning; exact.
+
+    Per block of query rows, the categorical and grade scores come exactly from
+    ``component_tables``. A dimension term is at most 1 and exactly 0 unless both
+    rows have that dimension, so the present-in-both count bounds the dimension
+    score. The bound is combined in the same order as the real score, and
+    rounding is monotone, so with non-negative weights it never falls below the
+    computed score. The PRUNE_SEEDS best-bounded candidates are scored in full,
+    and their k-th best score is the threshold. Only candidates whose bound
+    reaches it get the dimension-overlap work. Everything skipped scores below
+    the true k-th best, so indices and values equal ``iter_top_k_blocks``.
+    """
+    if weights and any(w < 0 for w in weights.values()):
+        raise ValueError("bound pruning needs non-negative weights")
+    n = len(packed["id_codes"])
+    dtype = packed["grade_mid"].dtype
+    dim_mask = dim_presence_mask(packed)
+    cats, grades = component_tables(packed)
+    block_size = block_size or default_block_size(n)
+    for lo in range(0, n, block_size):
+        rows = np.arange(lo, min(lo + block_size, n))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if cats is not None:
+                cat_sim = cats[1][cats[0][rows, None], cats[0][None, :]]
+            else:
+                cat_sim = _cat_terms({"cat_codes": packed["cat_codes"][rows][:, None, :]},
+                                     {"cat_codes": packed["cat_codes"][None, :, :]}, dtype)
+            if grades is not None:
+                grade_sim = grades[1][grades[0][rows, None], grades[0][None, :]]
+            else:
+                grade_sim = _grade_terms({"grade_mid": packed["grade_mid"][rows][:, None, :]},
+                                         {"grade_mid": packed["grade_mid"][None, :, :]})
+        dim_bound = _POPCOUNT[dim_mask[rows, None] & dim_mask[None, :]].astype(dtype)
+        dim_bound /= packed["dim_min"].shape[1]
+        bounds = combine_scores(dim_bound, cat_sim, grade_sim, mode=mode, weights=weights)
+        bounds[packed["id_codes"][rows, None] == packed["id_codes"][None, :]] = -np.inf
+        if mode in ("grade", "categorical"):
+            # No dimension term: the bound is the score
+            yield (rows, *top_k_rows(bounds, k), 0)
+            continue
+
+        def pair_scores(r, c):
+            # Only the dimension term is computed here; the others are exact already
+            q = {key: packed[key][rows[r]] for key in ["dim_min", "dim_max"]}
+            cand = {key: packed[key][c] for key in ["dim_min", "dim_max"]}
+            with np.errstate(invalid='ignore', divide='ignore'):
+                dim_sim = _dim_terms(q, cand)
+            return combine_scores(dim_sim, cat_sim[r, c], grade_sim[r, c], mode=mode, weights=weights)
+
+        # Threshold: k-th best real score among the best-bounded seeds
+        m = min(n, max(PRUNE_SEEDS, k))
+        seeds = np.argpartition(-bounds, m - 1, axis=1)[:, :m]
+        seed_scores = pair_scores(np.repeat(np.arange(len(rows)), m), seeds.ravel()).reshape(-1, m)
+        seed_scores[np.take_along_axis(bounds, seeds, axis=1) == -np.inf] = -np.inf
+        kth = -np.partition(-seed_scores, k - 1, axis=1)[:, k - 1] if m >= k \
+            else np.full(len(rows), -np.inf)
+
+        r, c = np.nonzero((bounds >= kth[:, None]) & (bounds > -np.inf))
+        scores = np.full(bounds.shape, -np.inf, dtype=bounds.dtype)
+        scores[r, c] = pair_scores(r, c)
+        idx, vals = top_k_rows(scores, k)
+        scored = len(r) + int((np.take_along_axis(scores, seeds, axis=1) == -np.inf).sum())
+        yield rows, idx, vals, scored
+
+def pruned_top_k(rfq_enriched, k=3, mode="all", weights=None, block_size=None, return_stats=False):
+    """Top-k similarity with upper-bound pruning; same output as ``vectorized_top_k``.
+
+    With ``return_stats`` also returns the candidate pairs, the pairs whose
+    dimension overlap was computed and the pruning rate (share of pairs skipped).
+    """
+    packed = pack_features(rfq_enriched)
+    n = len(packed["ids"])
+    frames, scored = [], 0
+    for rows, idx, vals, block_scored in pruned_top_k_blocks(packed, k, mode, weights, block_size):
+        frames.append(top_k_frame(packed, rows, idx, vals))
+        scored += block_scored
+    result = _concat_frames(frames)
+    if not return_stats:
+        return result
+    _, counts = np.unique(packed["id_codes"], return_counts=True)
+    pairs = n * n - int((counts ** 2).sum())
+    return result, {"pairs": pairs, "scored": scored, "pruning_rate": 1 - scored / pairs if pairs else 0.0}
+
+# ---------- chunked streaming to disk ----------
+def ids_fingerprint(packed):
+    """SHA-1 of the packed ids, used to tie on-disk artifacts to one RFQ book."""
+    return hashlib.sha1("\n".join(map(str, packed["ids"])).encode()).hexdigest()
+
+def features_fingerprint(packed):
+    """SHA-1 over the dtype, shape and bytes of the packed scoring features.
+
+    Ties on-disk scores to the feature values, so a book whose ids stay the same
+    but whose dimensions, categoricals or grades changed is never served stale.
+    """
+    digest = hashlib.sha1()
+    for key in FEATURE_KEYS:
+        array = np.ascontiguousarray(packed[key])
+        digest.update(f"{key}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+def _chunk_path(out_dir, start):
+    return os.path.join(out_dir, f"chunk_{start:010d}.csv")
+
+def stream_top_k(rfq_enriched, out_dir, k=3, mode="all", weights=None,
+                 block_size=1024, col_block_size=8192):
+    """Compute top-k in row chunks and write each chunk to ``out_dir`` as it finishes.
+
+    Chunks already on disk from an interrupted run with the same settings are
+    skipped, so a long run resumes from the last completed chunk. Chunks of the
+    same ids with different feature values are discarded and recomputed. Peak
+    memory is set by block_size x col_block_size. Returns the list of chunk paths in order.
+    """
+    packed = pack_features(rfq_enriched)
+    n = len(packed["ids"])
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = {"n_rows": n, "ids_sha1": ids_fingerprint(packed), "features_sha1": features_fingerprint(packed),
+                "k": k, "mode": mode, "weights": weights, "block_size": block_size}
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous.get("features_sha1") != manifest["features_sha1"] and \
+                {key: value for key, value in previous.items() if key != "features_sha1"} == \
+                {key: value for key, value in manifest.items() if key != "features_sha1"}:
+            # Same run over edited features: the finished chunks are stale
+            for path in glob.glob(os.path.join(out_dir, "chunk_*.csv")):
+                os.remove(path)
+            previous = manifest
+            with open(manifest_path, "w") as f:
+                json.dump(manifest, f)
+        if previous != manifest:
+            raise ValueError(f"{out_dir} holds chunks from a different run: {previous}")
+    else:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+
+    paths = []
+    for start in range(0, n, block_size):
+        path = _chunk_path(out_dir, start)
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        for rows, idx, vals in iter_top_k_blocks(packed, k, mode, weights, block_size, start,
+                                                 min(start + block_size, n), col_block_size):
+            tmp_path = path + ".tmp"
+            top_k_frame(packed, rows, idx, vals).to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+    return paths
+
+def read_top_k_chunks(out_dir):
+    """Concatenate the chunk files written by stream_top_k.
+
+    Scores are parsed with ``float_precision="round_trip"``, so they equal the
+    in-memory engine's bit for bit.
+    """
+    paths = sorted(glob.glob(os.path.join(out_dir, "chunk_*.csv")))
+    return _concat_frames([pd.read_csv(p, float_precision="round_trip") for p in paths])
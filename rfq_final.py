@@ -1,6 +1,10 @@
 import pandas as pd
 import numpy as np
+import hashlib
+import os
 import re
+import rfq_engine
+import rfq_grades
 
 # ---------- helpers ----------
 def parse_range(value):
@@ -31,6 +35,24 @@ def midpoint(min_val, max_val):
         return min_val
     return (min_val + max_val) / 2
 
+# A float literal once parse_range's character filter has run (digits and dots only)
+_NUMBER = r'(\d+\.?\d*|\.\d+)'
+
+def parse_range_series(values):
+    """Columnar parse_range: returns (min, max) float Series aligned with ``values``.
+
+    Each distinct string is parsed once with vectorized regex extraction.
+    """
+    values = pd.Series(values)
+    uniques = pd.Series(values.dropna().unique(), dtype=object)
+    cleaned = uniques.astype(str).str.replace(r'[^\d\.\-–]', '', regex=True)
+    pair = cleaned.str.extract(rf'^{_NUMBER}[-–]{_NUMBER}$')
+    single = cleaned.str.extract(rf'^{_NUMBER}$')[0]
+    lo = pair[0].fillna(single).astype(float)
+    hi = pair[1].fillna(single).astype(float)
+    lo.index = hi.index = uniques
+    return (values.map(lo).astype(float), values.map(hi).astype(float))
+
 def interval_overlap(min1, max1, min2, max2):
     """Normalized overlap ratio between two intervals."""
     if pd.isna(min1) or pd.isna(max1) or pd.isna(min2) or pd.isna(max2):
@@ -40,17 +62,79 @@ def interval_overlap(min1, max1, min2, max2):
     return overlap / total if total > 0 else 0
 
 # ---------- enrichment ----------
-def enrich_rfq(rfq_path, reference_path):
-    """Join RFQs with grade reference and parse numeric ranges."""
+# Reference range columns and the midpoint column derived from each
+GRADE_NUMERIC_COLS = [
+    ('Tensile strength (Rm)', 'tensile_mid'),
+    ('Yield strength (Re or Rp0.2)', 'yield_mid'),
+    ('Elongation (A%)', 'elongation_mid'),
+    ('Reduction of area (Z%)', 'reduction_mid'),
+    ('Hardness (HB, HV, HRC)', 'hardness_mid')
+]
+
+# Parsed grade tables by reference file content hash
+_GRADE_TABLE_CACHE = {}
+
+def parse_grade_table(reference):
+    """Normalize grades and parse range columns into min/max/midpoint once per reference row.
+
+    Returns (table, parsed_cols) where parsed_cols lists the added columns in order.
+    """
+    table = reference.copy()
+    table['Grade/Material'] = table['Grade/Material'].str.upper().str.strip()
+    parsed_cols = []
+    for col, mid_col in GRADE_NUMERIC_COLS:
+        if col in table.columns:
+            lo, hi = parse_range_series(table[col])
+            table[f"{col}_min"], table[f"{col}_max"] = lo, hi
+            # Midpoint column-wise: mean when both bounds exist, otherwise whichever exists
+            table[mid_col] = np.where(lo.notna() & hi.notna(), (lo + hi) / 2, lo.fillna(hi))
+            parsed_cols += [f"{col}_min", f"{col}_max", mid_col]
+        else:
+            table[mid_col] = np.nan
+            parsed_cols.append(mid_col)
+    return table, parsed_cols
+
+def load_grade_table(reference_path, cache_dir=None):
+    """Parsed grade table for a reference file, cached in memory and optionally in ``cache_dir``.
+
+    The cache key is the file's SHA-1, so editing the reference invalidates it.
+    """
+    with open(reference_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    if digest in _GRADE_TABLE_CACHE:
+        return _GRADE_TABLE_CACHE[digest]
+
+    cache_path = os.path.join(cache_dir, f"grade_table_{digest}.pkl") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        table, parsed_cols = pd.read_pickle(cache_path)
+    else:
+        table, parsed_cols = parse_grade_table(pd.read_csv(reference_path, sep='\t'))
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            pd.to_pickle((table, parsed_cols), cache_path)
+
+    _GRADE_TABLE_CACHE[digest] = (table, parsed_cols)
+    return table, parsed_cols
+
+def enrich_rfq(rfq_path, reference_path, cache_dir=None):
+    """Join RFQs with grade reference and parse numeric ranges.
+
+    Reference ranges are parsed once per grade before the join (see load_grade_table);
+    ``cache_dir`` keeps the parsed table on disk between runs. Grades (with their
+    ``grade_suffix``) are resolved to reference grades through rfq_grades, so
+    spelling variants and suffixed grades join too; exact matches join as before.
+    """
     rfq = pd.read_csv(rfq_path)
-    reference = pd.read_csv(reference_path, sep='\t')
+    reference, parsed_cols = load_grade_table(reference_path, cache_dir)
+    grades = rfq_grades.grade_index(reference['Grade/Material'].dropna().tolist())
 
-    # Normalize grades
+    # Normalize grades and resolve them against the reference
     rfq['grade'] = rfq['grade'].str.upper().str.strip()
-    reference['Grade/Material'] = reference['Grade/Material'].str.upper().str.strip()
+    reference_grade = grades.resolve_series(rfq['grade'], rfq.get('grade_suffix'))
 
     # Merge
-    rfq_enriched = rfq.merge(reference, how='left', left_on='grade', right_on='Grade/Material')
+    rfq_enriched = rfq.merge(reference, how='left', left_on=reference_grade.rename(None).to_numpy(),
+                             right_on='Grade/Material')
 
     # Numeric RFQ ranges: thickness, width, length, height, weight, inner/outer diameters
     dim_cols = [
@@ -65,26 +149,50 @@ def enrich_rfq(rfq_path, reference_path):
         rfq_enriched[min_col] = rfq_enriched.get(min_col, np.nan)
         rfq_enriched[max_col] = rfq_enriched.get(max_col, np.nan)
 
-    # Grade numeric properties
-    grade_numeric_cols = [
-        ('Tensile strength (Rm)', 'tensile_mid'),
-        ('Yield strength (Re or Rp0.2)', 'yield_mid'),
-        ('Elongation (A%)', 'elongation_mid'),
-        ('Reduction of area (Z%)', 'reduction_mid'),
-        ('Hardness (HB, HV, HRC)', 'hardness_mid')
-    ]
-    for col, mid_col in grade_numeric_cols:
-        if col in rfq_enriched.columns:
-            rfq_enriched[[f"{col}_min", f"{col}_max"]] = rfq_enriched[col].apply(lambda x: pd.Series(parse_range(x)))
-            rfq_enriched[mid_col] = rfq_enriched.apply(lambda row: midpoint(row[f"{col}_min"], row[f"{col}_max"]), axis=1)
-        else:
-            rfq_enriched[mid_col] = np.nan
+    # Grade numeric properties come pre-parsed; keep them after the dimension columns
+    rfq_enriched = rfq_enriched[[c for c in rfq_enriched.columns if c not in parsed_cols] + parsed_cols]
 
     return rfq_enriched
 
 # ---------- similarity ----------
-def compute_top3_similarity(rfq_enriched):
-    """Compute top-3 similar RFQs for each RFQ."""
+def compute_top3_similarity(rfq_enriched, engine="numpy", block_size=None,
+                            col_block_size=None, out_dir=None, workers=None, k=3, weights=None, dedupe=False):
+    """Compute top-3 (or top-``k``) similar RFQs for each RFQ.
+
+    engine="numpy" scores blocks of rows with broadcasting (see rfq_engine);
+    engine="pruned" skips the dimension work of candidates whose score upper
+    bound cannot reach the k-th best (same output, see rfq_engine.pruned_top_k;
+    it runs in memory in one process, so ``out_dir``/``workers``/``col_block_size``
+    raise ValueError);
+    engine="loop" is the original pairwise reference implementation.
+    With ``out_dir`` the numpy engine streams row chunks to disk and resumes
+    from completed chunks; ``col_block_size`` bounds memory per tile.
+    ``workers`` > 1 spreads query rows over a process pool. ``dedupe=True`` scores
+    each distinct feature row once (see rfq_dedupe); the output is the same. It
+    runs in memory in one process with the numpy engine only, and raises
+    ValueError otherwise.
+    """
+    if dedupe and engine != "numpy":
+        raise ValueError(f"dedupe=True needs engine='numpy', not {engine!r}")
+    if engine == "numpy":
+        if dedupe:
+            import rfq_dedupe
+            rfq_engine.reject_options("dedupe=True", out_dir=out_dir, workers=workers,
+                                      col_block_size=col_block_size)
+            return rfq_dedupe.deduplicated_top_k(rfq_enriched, k=k, weights=weights, block_size=block_size)
+        if out_dir:
+            rfq_engine.stream_top_k(rfq_enriched, out_dir, k=k, weights=weights,
+                                    block_size=block_size or 1024, col_block_size=col_block_size or 8192)
+            return rfq_engine.read_top_k_chunks(out_dir)
+        return rfq_engine.vectorized_top_k(rfq_enriched, k=k, weights=weights, block_size=block_size,
+                                           col_block_size=col_block_size, workers=workers)
+    if engine == "pruned":
+        rfq_engine.reject_options('engine="pruned"', out_dir=out_dir, workers=workers, col_block_size=col_block_size)
+        return rfq_engine.pruned_top_k(rfq_enriched, k=k, weights=weights, block_size=block_size)
+    if engine != "loop":
+        raise ValueError(f"Unknown engine: {engine}")
+
+    w = weights if weights else rfq_engine.DEFAULT_WEIGHTS
     rfq_ids = rfq_enriched['id'].tolist()
     results = []
 
@@ -124,11 +232,11 @@ def compute_top3_similarity(rfq_enriched):
             grade_sim = np.mean(grade_sims)
 
             # Weighted total similarity
-            total_sim = 0.4*dim_sim + 0.3*cat_sim + 0.3*grade_sim
+            total_sim = w["dim"]*dim_sim + w["cat"]*cat_sim + w["grade"]*grade_sim
             similarities.append((id2, total_sim))
 
-        # Top 3 matches
-        similarities = sorted(similarities, key=lambda x: x[1], reverse=True)[:3]
+        # Top k matches
+        similarities = sorted(similarities, key=lambda x: x[1], reverse=True)[:k]
         for match_id, score in similarities:
             results.append({'rfq_id': id1, 'match_id': match_id, 'similarity_score': score})
 
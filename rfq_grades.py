@@ -0,0 +1,127 @@
+# rfq_grades.py
+import pandas as pd
+import numpy as np
+
+# Separators dropped from the alias form, so "S355 J2", "S355-J2" and "s355j2" meet
+_SEPARATORS = str.maketrans("", "", " -_./")
+# Shortest reference grade a longest-prefix match may return ("X" alone says nothing)
+PREFIX_MIN_LEN = 2
+# Built indexes by their reference grade list
+_INDEX_CACHE = {}
+
+# ---------- normalization ----------
+def normalize_grade(value):
+    """Upper-case and strip, as the reference join has always done; None when missing."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return str(value).upper().strip()
+
+def alias_key(value):
+    """Normalized grade without separators (the alias and trie key)."""
+    return normalize_grade(value).translate(_SEPARATORS)
+
+# ---------- index ----------
+class GradeIndex:
+    """Resolve free-text grades to reference grades, built once from ``Grade/Material``.
+
+    A grade resolves, in order, by exact normalized match (the original join), by
+    alias (same grade without separators: ``S355-J2`` -> ``S355J2``) and by longest
+    reference prefix in a character trie (``DX51D+Z`` -> ``DX51D``,
+    ``S355J2H`` -> ``S355J2``). A prefix never ends inside a number, so ``C500``
+    does not resolve to ``C50``. Given a ``grade_suffix``, ``grade+suffix`` is tried
+    before the bare grade (``S355J2`` + ``N`` -> ``S355J2+N``). Lookups are
+    memoized per (grade, suffix) and each costs O(len) otherwise.
+    """
+
+    def __init__(self, grades):
+        self.grades = [g for g in dict.fromkeys(normalize_grade(g) for g in grades) if g]
+        self.exact = {g: g for g in self.grades}
+        self.alias = {}
+        self.trie = {}
+        for g in self.grades:
+            key = alias_key(g)
+            # Reference order decides between grades that only differ in separators
+            self.alias.setdefault(key, g)
+            node = self.trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node.setdefault(None, g)
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.grades)
+
+    def _prefix(self, key):
+        node, best = self.trie, None
+        for depth, ch in enumerate(key):
+            node = node.get(ch)
+            if node is None:
+                break
+            nxt = key[depth + 1] if depth + 1 < len(key) else ""
+            if None in node and depth + 1 >= PREFIX_MIN_LEN and not (ch.isdigit() and nxt.isdigit()):
+                best = node[None]
+        return best
+
+    def explain(self, grade, suffix=None):
+        """(reference grade or None, how): how is exact, alias, prefix, unresolved or missing."""
+        memo_key = (grade, suffix)
+        if memo_key in self._memo:
+            return self._memo[memo_key]
+        base = normalize_grade(grade)
+        if base is None:
+            result = (None, "missing")
+        else:
+            suffix = normalize_grade(suffix)
+            candidates = [f"{base}+{suffix.lstrip('+')}", base] if suffix else [base]
+            result = next(((self.exact[c], "exact") for c in candidates if c in self.exact), None) \
+                or next(((self.alias[k], "alias") for k in map(alias_key, candidates) if k in self.alias), None)
+            if result is None:
+                found = self._prefix(alias_key(candidates[0]))
+                result = (found, "prefix") if found else (None, "unresolved")
+        self._memo[memo_key] = result
+        return result
+
+    def resolve(self, grade, suffix=None):
+        """Reference grade for one raw grade (and optional suffix), or None."""
+        return self.explain(grade, suffix)[0]
+
+    def _distinct(self, grades, suffixes):
+        """Distinct (grade, suffix) pairs and each row's pair."""
+        g_codes, g_values = pd.factorize(pd.Series(grades, dtype=object), use_na_sentinel=False)
+        if suffixes is None:
+            return [(g, None) for g in g_values], g_codes
+        s_codes, s_values = pd.factorize(pd.Series(suffixes, dtype=object), use_na_sentinel=False)
+        pairs, inverse = np.unique(g_codes.astype(np.int64) * len(s_values) + s_codes, return_inverse=True)
+        return [(g_values[p // len(s_values)], s_values[p % len(s_values)]) for p in pairs], inverse.ravel()
+
+    def resolve_series(self, grades, suffixes=None):
+        """Columnar resolve: reference grades aligned with ``grades`` (NaN when unresolved).
+
+        Each distinct (grade, suffix) is resolved once, then broadcast back.
+        """
+        index = grades.index if isinstance(grades, pd.Series) else None
+        pairs, inverse = self._distinct(grades, suffixes)
+        resolved = np.array([self.resolve(g, s) for g, s in pairs] or [None], dtype=object)[inverse]
+        return pd.Series(resolved, index=index, dtype=object).where(pd.notna(resolved), np.nan)
+
+    def match_stats(self, grades, suffixes=None):
+        """Row counts per resolution method, plus the exact and resolved match rates."""
+        pairs, inverse = self._distinct(grades, suffixes)
+        how = np.array([self.explain(g, s)[1] for g, s in pairs] or ["missing"], dtype=object)[inverse]
+        counts = {m: int((how == m).sum()) for m in ["exact", "alias", "prefix", "unresolved", "missing"]}
+        rows = len(how)
+        counts["exact_rate"] = counts["exact"] / rows if rows else 0.0
+        counts["resolved_rate"] = (counts["exact"] + counts["alias"] + counts["prefix"]) / rows if rows else 0.0
+        return counts
+
+def grade_index(grades):
+    """Shared GradeIndex for a list of reference grades, built once per list."""
+    key = tuple(grades)
+    if key not in _INDEX_CACHE:
+        _INDEX_CACHE[key] = GradeIndex(key)
+    return _INDEX_CACHE[key]
+
+def load_grade_index(reference_path):
+    """GradeIndex over the ``Grade/Material`` column of a reference TSV."""
+    grades = pd.read_csv(reference_path, sep='\t', usecols=['Grade/Material'])['Grade/Material']
+    return grade_index(grades.dropna().astype(str).tolist())
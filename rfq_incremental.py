@@ -0,0 +1,135 @@
+# rfq_incremental.py
+import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
+import rfq_engine
+
+# ---------- state ----------
+def scoring_columns(rfq_enriched):
+    """Columns pack_features reads that are present in the frame."""
+    cols = [f"{dim}_{side}" for dim in rfq_engine.DIM_COLS for side in ("min", "max")]
+    cols += rfq_engine.CAT_COLS + rfq_engine.GRADE_MID_COLS
+    return [c for c in cols if c in rfq_enriched.columns]
+
+def row_hashes(rfq_enriched):
+    """uint64 content hash of each row's scoring columns."""
+    return pd.util.hash_pandas_object(rfq_enriched[scoring_columns(rfq_enriched)], index=False).to_numpy()
+
+def save_state(state_dir, settings, ids, hashes, idx, vals):
+    """Write the ids, row hashes and top-k arrays of a run; ``state.json`` is written last."""
+    tmp_dir = state_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    pd.Series(ids).to_pickle(os.path.join(tmp_dir, "ids.pkl"))
+    np.save(os.path.join(tmp_dir, "hashes.npy"), hashes)
+    np.save(os.path.join(tmp_dir, "idx.npy"), idx)
+    np.save(os.path.join(tmp_dir, "vals.npy"), vals)
+    with open(os.path.join(tmp_dir, "state.json"), "w") as f:
+        json.dump(settings, f)
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.replace(tmp_dir, state_dir)
+
+def load_state(state_dir):
+    """(settings, ids, hashes, idx, vals) of the previous run, or None."""
+    path = os.path.join(state_dir, "state.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        settings = json.load(f)
+    ids = pd.read_pickle(os.path.join(state_dir, "ids.pkl")).to_numpy()
+    arrays = [np.load(os.path.join(state_dir, f"{name}.npy")) for name in ["hashes", "idx", "vals"]]
+    return (settings, ids, *arrays)
+
+# ---------- update ----------
+def top_k_for_rows(packed, rows, k=3, mode="all", weights=None, block_size=None):
+    """Full top-k (indices, values) for an arbitrary set of query rows."""
+    idx = np.full((len(rows), k), -1, dtype=np.int64)
+    vals = np.full((len(rows), k), -np.inf)
+    block_size = block_size or rfq_engine.default_block_size(len(packed["id_codes"]))
+    for lo in range(0, len(rows), block_size):
+        block = rows[lo:lo + block_size]
+        scores = rfq_engine._score_tile(packed, block, None, mode, weights)
+        idx[lo:lo + len(block)], vals[lo:lo + len(block)] = rfq_engine.top_k_rows(scores, k)
+    return idx, vals
+
+def _row_keys(ids):
+    """(id, occurrence) per row; enrichment can repeat an RFQ when its grade has several reference rows."""
+    ids = pd.Series(ids)
+    return pd.MultiIndex.from_arrays([ids, ids.groupby(ids, sort=False).cumcount()])
+
+def _diff(state, ids, hashes):
+    """Map the previous run onto the current rows.
+
+    Returns (old_to_new, unchanged_old) or None when kept rows changed their
+    relative order, which an incremental update could not reproduce (ties are
+    broken by row position).
+    """
+    _, old_ids, old_hashes, _, _ = state
+    old_to_new = _row_keys(ids).get_indexer(_row_keys(old_ids))
+    unchanged_old = old_to_new >= 0
+    unchanged_old[unchanged_old] = old_hashes[unchanged_old] == hashes[old_to_new[unchanged_old]]
+    if np.any(np.diff(old_to_new[unchanged_old]) <= 0):
+        return None
+    return old_to_new, unchanged_old
+
+def incremental_top_k(rfq_enriched, state_dir, k=3, mode="all", weights=None, block_size=None):
+    """Top-k similarity that reuses the previous run stored in ``state_dir``.
+
+    Rows are diffed against the previous run by ``id`` (and occurrence) and
+    content hash. New and changed rows are scored against every row. Kept rows merge their stored
+    top-k with their scores against the new and changed rows. Kept rows whose
+    stored list held a removed or changed RFQ are rescored in full. The cost is
+    O(dN * N), and the output equals ``rfq_engine.vectorized_top_k``. Anything
+    that would break that (other settings or columns, reordered rows) falls back
+    to a full recompute. Returns (frame, stats).
+    """
+    packed = rfq_engine.pack_features(rfq_enriched)
+    ids, n = packed["ids"], len(packed["ids"])
+    hashes = row_hashes(rfq_enriched)
+    settings = {"k": k, "mode": mode, "weights": weights, "columns": scoring_columns(rfq_enriched),
+                "dtype": str(packed["grade_mid"].dtype)}
+
+    state = load_state(state_dir)
+    diff = _diff(state, ids, hashes) if state is not None and state[0] == settings else None
+    if diff is None:
+        idx, vals = top_k_for_rows(packed, np.arange(n), k, mode, weights, block_size)
+        stats = {"full_recompute": True, "rows": n, "rescored": n}
+    else:
+        old_to_new, unchanged_old = diff
+        _, old_ids, _, old_idx, old_vals = state
+        kept_old = np.flatnonzero(unchanged_old)
+        kept = old_to_new[kept_old]
+        dirty = np.setdiff1d(np.arange(n), kept)
+
+        # Kept rows whose stored list references a removed or changed row
+        refs = old_idx[kept_old]
+        stale = np.any((refs >= 0) & ~unchanged_old[np.maximum(refs, 0)], axis=1)
+        rescore = np.union1d(dirty, kept[stale])
+
+        idx = np.full((n, k), -1, dtype=np.int64)
+        vals = np.full((n, k), -np.inf)
+        idx[rescore], vals[rescore] = top_k_for_rows(packed, rescore, k, mode, weights, block_size)
+
+        merge_old = kept_old[~stale]
+        rows = old_to_new[merge_old]
+        base_idx = np.where(old_idx[merge_old] >= 0, old_to_new[np.maximum(old_idx[merge_old], 0)], -1)
+        base_vals = old_vals[merge_old]
+        if len(dirty):
+            step = block_size or rfq_engine.default_block_size(len(dirty))
+            for lo in range(0, len(rows), step):
+                block = slice(lo, lo + step)
+                scores = rfq_engine._score_tile(packed, rows[block], dirty, mode, weights)
+                tile_idx, tile_vals = rfq_engine.top_k_rows(scores, k, dirty)
+                base_idx[block], base_vals[block] = rfq_engine.merge_top_k(
+                    base_idx[block], base_vals[block], tile_idx, tile_vals, k)
+        idx[rows], vals[rows] = base_idx, base_vals
+
+        added = int((_row_keys(old_ids).get_indexer(_row_keys(ids)) < 0).sum())
+        stats = {"full_recompute": False, "rows": n, "added": added,
+                 "changed": int(len(dirty) - added), "removed": int((old_to_new < 0).sum()),
+                 "rescored": int(len(rescore))}
+
+    save_state(state_dir, settings, ids, hashes, idx, vals)
+    return rfq_engine.top_k_frame(packed, np.arange(n), idx, vals), stats
@@ -0,0 +1,151 @@
+# rfq_index.py
+import pandas as pd
+import numpy as np
+import rfq_engine
+
+# Categorical keys used for blocking and dimensions used for interval pruning
+BLOCK_KEYS = ['form', 'coating']
+INDEX_DIMS = ['thickness', 'width']
+
+# ---------- index ----------
+def build_candidate_index(rfq_enriched, keys=BLOCK_KEYS, dims=INDEX_DIMS, packed=None):
+    """Build hash buckets on categorical keys plus sorted dimension bounds per bucket.
+
+    Missing key values form their own bucket. Inside a bucket rows are sorted by the
+    lower bound of the first index dimension, so every row that can overlap a query
+    range lies in a prefix found with ``searchsorted``.
+    """
+    packed = packed if packed is not None else rfq_engine.pack_features(rfq_enriched)
+    n = len(packed["ids"])
+
+    key_codes = np.zeros((n, len(keys)), dtype=np.int64)
+    for c, col in enumerate(keys):
+        if col in rfq_enriched.columns:
+            key_codes[:, c], _ = pd.factorize(rfq_enriched[col], use_na_sentinel=False)
+
+    dim_pos = [rfq_engine.DIM_COLS.index(d) for d in dims]
+    first_min = packed["dim_min"][:, dim_pos[0]] if dim_pos else np.zeros(n)
+
+    buckets = {}
+    if n:
+        bucket_of = np.zeros(n, dtype=np.int64)
+        if len(keys):
+            _, bucket_of = np.unique(key_codes, axis=0, return_inverse=True)
+            bucket_of = bucket_of.ravel()
+        for b in np.unique(bucket_of):
+            members = np.flatnonzero(bucket_of == b)
+            members = members[np.argsort(first_min[members], kind='stable')]
+            buckets[tuple(key_codes[members[0]])] = {
+                "rows": members,
+                "sorted_min": first_min[members],
+            }
+
+    return {
+        "packed": packed,
+        "keys": list(keys),
+        "dims": list(dims),
+        "dim_pos": dim_pos,
+        "key_codes": key_codes,
+        "buckets": buckets,
+    }
+
+def _overlap_mask(packed, dim_pos, rows, cols):
+    """True where candidate ranges overlap the query ranges on every index dimension.
+
+    A dimension the query leaves open does not filter; a candidate with a missing
+    bound on a filtered dimension is dropped.
+    """
+    mask = np.ones((len(rows), len(cols)), dtype=bool)
+    for d in dim_pos:
+        qmin, qmax = packed["dim_min"][rows, d, None], packed["dim_max"][rows, d, None]
+        cmin, cmax = packed["dim_min"][None, cols, d], packed["dim_max"][None, cols, d]
+        open_query = np.isnan(qmin) | np.isnan(qmax)
+        mask &= open_query | ((cmin <= qmax) & (cmax >= qmin))
+    return mask
+
+def query_candidates(index, row):
+    """Candidate rows for one query row: same bucket and overlapping index dimensions."""
+    packed = index["packed"]
+    bucket = index["buckets"][tuple(index["key_codes"][row])]
+    pool = bucket["rows"]
+    if index["dim_pos"]:
+        qmax = packed["dim_max"][row, index["dim_pos"][0]]
+        if not np.isnan(qmax):
+            pool = pool[:np.searchsorted(bucket["sorted_min"], qmax, side='right')]
+    pool = pool[_overlap_mask(packed, index["dim_pos"], [row], pool)[0]]
+    return pool[packed["id_codes"][pool] != packed["id_codes"][row]]
+
+# ---------- pruned top-k ----------
+def _pruned_block(index, rows, pool, k, mode, weights, filter_dims):
+    packed = index["packed"]
+    scores = rfq_engine._score_tile(packed, rows, pool, mode, weights)
+    if filter_dims:
+        scores[~_overlap_mask(packed, index["dim_pos"], rows, pool)] = -np.inf
+    idx, vals = rfq_engine.top_k_rows(scores, k, pool)
+    return idx, vals, (scores > -np.inf).sum(axis=1)
+
+def indexed_top_k(rfq_enriched, k=3, mode="all", weights=None, keys=BLOCK_KEYS, dims=INDEX_DIMS,
+                  exact=True, block_size=256, index=None):
+    """Top-k similarity scored only against candidates from the blocking index.
+
+    Each query is first scored against rows in its bucket whose index dimensions
+    overlap; if that yields fewer than k candidates the dimension filter is dropped.
+    With ``exact=True`` rows that still have fewer than k candidates fall back to a
+    full scan. The ``full_scan`` column flags those rows.
+    """
+    index = index if index is not None else build_candidate_index(rfq_enriched, keys, dims)
+    packed = index["packed"]
+    n = len(packed["ids"])
+    idx_all = np.full((n, k), -1, dtype=np.int64)
+    val_all = np.full((n, k), -np.inf)
+    short = []
+
+    first = index["dim_pos"][0] if index["dim_pos"] else None
+    for bucket in index["buckets"].values():
+        pool, sorted_min = bucket["rows"], bucket["sorted_min"]
+        # Queries ordered by upper bound so each block only needs a prefix of the pool
+        queries = pool
+        if first is not None:
+            queries = pool[np.argsort(packed["dim_max"][pool, first], kind='stable')]
+        for lo in range(0, len(queries), block_size):
+            rows = queries[lo:lo + block_size]
+            end = len(pool)
+            if first is not None:
+                qmax = packed["dim_max"][rows, first]
+                if not np.isnan(qmax).any():
+                    end = np.searchsorted(sorted_min, qmax.max(), side='right')
+            idx, vals, found = _pruned_block(index, rows, pool[:end], k, mode, weights, True)
+            relax = found < k
+            if relax.any():
+                # Too few overlapping rows: fall back to the whole bucket
+                r_idx, r_vals, r_found = _pruned_block(index, rows[relax], pool, k, mode, weights, False)
+                idx[relax], vals[relax] = r_idx, r_vals
+                short.extend(rows[relax][r_found < k])
+            idx_all[rows], val_all[rows] = idx, vals
+
+    full_scan = np.zeros(n, dtype=bool)
+    if exact and short:
+        short = np.sort(np.asarray(short, dtype=np.int64))
+        full_scan[short] = True
+        for lo in range(0, len(short), block_size):
+            rows = short[lo:lo + block_size]
+            idx_all[rows], val_all[rows] = rfq_engine.top_k_rows(
+                rfq_engine._score_tile(packed, rows, None, mode, weights), k)
+
+    result = rfq_engine.top_k_frame(packed, np.arange(n), idx_all, val_all)
+    result['full_scan'] = np.repeat(full_scan, (idx_all >= 0).sum(axis=1))
+    return result
+
+# ---------- evaluation ----------
+def recall_at_k(pruned, brute):
+    """Share of brute-force (rfq_id, match_id) pairs recovered, plus mean score loss.
+
+    Pairs are compared as sets per RFQ; the score loss is the mean difference of the
+    summed top-k scores, which stays 0 when ties are resolved to other equally good rows.
+    """
+    key = ['rfq_id', 'match_id']
+    hits = brute[key].merge(pruned[key].drop_duplicates(), on=key, how='inner')
+    pair_recall = len(hits) / len(brute) if len(brute) else 1.0
+    b_sum = brute.groupby('rfq_id')['similarity_score'].sum()
+    p_sum = pruned.groupby('rfq_id')['similarity_score'].sum().reindex(b_sum.index, fill_value=0)
+    return {"pair_recall": pair_recall, "mean_score_loss": float((b_sum - p_sum).mean())}
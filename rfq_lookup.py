@@ -0,0 +1,188 @@
+# rfq_lookup.py
+import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
+import time
+import rfq_engine
+import rfq_final
+import rfq_grades
+
+# Packed arrays written to disk, one .npy each (memory-mapped on load)
+INDEX_ARRAYS = ["dim_min", "dim_max", "cat_codes", "grade_mid", "sorted_ids", "sorted_pos"]
+# Score cells per query tile (queries x index rows), sized so a tile's buffers stay in cache
+QUERY_TILE_CELLS = 65536
+
+class SimilarityIndex:
+    """Build-once similarity index over enriched RFQs for single-RFQ lookups.
+
+    Holds the packed features of the indexed book, the categorical vocabularies
+    used for its codes and the parsed grade table. ``query`` enriches one raw RFQ
+    against that table and scores it with the same arithmetic as
+    ``compute_top3_similarity``. ``save``/``load`` keep the arrays as ``.npy`` files
+    that are memory-mapped back in, so loading does not depend on the book size.
+    """
+
+    def __init__(self, arrays, ids, vocab, grades, grade_mids):
+        self.arrays = arrays
+        self.ids = ids
+        self.vocab = vocab
+        self.grades = grades
+        self.grade_mids = grade_mids
+        self._grade_pos = {g: i for i, g in enumerate(grades)}
+        self._grade_index = rfq_grades.grade_index(grades)
+        self._codes = {col: {v: i for i, v in enumerate(values)} for col, values in vocab.items()}
+
+    # ---------- build ----------
+    @classmethod
+    def build(cls, rfq_enriched, reference_path="data/reference_properties.tsv", cache_dir=None):
+        packed = rfq_engine.pack_features(rfq_enriched)
+        vocab = {}
+        for col in rfq_engine.CAT_COLS:
+            if col not in rfq_enriched.columns:
+                continue
+            series = rfq_enriched[col]
+            # Same order as the codes pack_features assigned
+            values = series.cat.categories if isinstance(series.dtype, pd.CategoricalDtype) \
+                else pd.factorize(series)[1]
+            vocab[col] = [v.item() if isinstance(v, np.generic) else v for v in values]
+
+        # First reference row per grade, as a single enriched row would see it
+        table, _ = rfq_final.load_grade_table(reference_path, cache_dir)
+        table = table.drop_duplicates('Grade/Material')
+        grades = table['Grade/Material'].astype(str).tolist()
+        grade_mids = table[rfq_engine.GRADE_MID_COLS].to_numpy(dtype=packed["grade_mid"].dtype)
+
+        ids = np.asarray(packed["ids"]).astype(str)
+        order = np.argsort(ids, kind='stable')
+        # Column-major, so a query reads each feature column contiguously
+        arrays = {key: np.asfortranarray(packed[key]) for key in rfq_engine.FEATURE_KEYS}
+        arrays["sorted_ids"], arrays["sorted_pos"] = ids[order], order
+        return cls(arrays, ids, vocab, grades, grade_mids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------- persistence ----------
+    def save(self, index_dir):
+        """Write the index to ``index_dir``; ``meta.json`` is written last."""
+        tmp_dir = index_dir.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for key in INDEX_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{key}.npy"), self.arrays[key])
+        np.save(os.path.join(tmp_dir, "ids.npy"), self.ids)
+        np.save(os.path.join(tmp_dir, "grade_mids.npy"), self.grade_mids)
+        meta = {"n_rows": len(self), "vocab": self.vocab, "grades": self.grades}
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(tmp_dir, index_dir)
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        """Load an index written by ``save``; arrays are read-only memory maps with ``mmap=True``."""
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = {key: np.load(os.path.join(index_dir, f"{key}.npy"), mmap_mode=mode) for key in INDEX_ARRAYS}
+        ids = np.load(os.path.join(index_dir, "ids.npy"), mmap_mode=mode)
+        grade_mids = np.load(os.path.join(index_dir, "grade_mids.npy"))
+        return cls(arrays, ids, meta["vocab"], meta["grades"], grade_mids)
+
+    # ---------- query ----------
+    def encode(self, rfq_row):
+        """Packed query arrays for one raw RFQ (a dict or Series with rfq.csv fields).
+
+        Mirrors enrich_rfq + pack_features: the grade (and ``grade_suffix``) is resolved
+        against the reference table with rfq_grades, missing dimensions become NaN, and categoricals take the
+        index codes (-1 when missing, -2 for a value the index has never seen).
+        """
+        row = rfq_row.to_dict() if isinstance(rfq_row, pd.Series) else dict(rfq_row)
+        dtype = self.arrays["grade_mid"].dtype
+
+        def number(key):
+            value = row.get(key)
+            if not isinstance(value, (int, float, np.number)):
+                value = pd.to_numeric(pd.Series([value]), errors='coerce').iloc[0]
+            return np.nan if pd.isna(value) else value
+
+        pos = self._grade_pos.get(self._grade_index.resolve(row.get('grade'), row.get('grade_suffix')))
+        cat_codes = np.zeros(len(rfq_engine.CAT_COLS), dtype=np.int64)
+        for c, col in enumerate(rfq_engine.CAT_COLS):
+            if col in self._codes:
+                value = row.get(col)
+                cat_codes[c] = -1 if pd.isna(value) else self._codes[col].get(value, -2)
+        return {
+            "dim_min": np.array([number(f"{dim}_min") for dim in rfq_engine.DIM_COLS], dtype=dtype),
+            "dim_max": np.array([number(f"{dim}_max") for dim in rfq_engine.DIM_COLS], dtype=dtype),
+            "cat_codes": cat_codes,
+            "grade_mid": self.grade_mids[pos] if pos is not None else np.full(len(rfq_engine.GRADE_MID_COLS),
+                                                                            np.nan, dtype=dtype),
+        }
+
+    def _positions(self, rfq_id):
+        """Rows of the index holding ``rfq_id`` (excluded from its own matches)."""
+        sorted_ids = self.arrays["sorted_ids"]
+        lo = np.searchsorted(sorted_ids, rfq_id, side='left')
+        hi = np.searchsorted(sorted_ids, rfq_id, side='right')
+        return self.arrays["sorted_pos"][lo:hi]
+
+    def search(self, rfq_rows, k=3, mode="all", weights=None):
+        """Top-k (indices, values) arrays of shape (len(rfq_rows), k) for a batch of raw RFQs.
+
+        All queries are scored together, one tile of QUERY_TILE_CELLS score cells at a
+        time, so the tile stays in cache whatever the batch size. Each query's own id
+        is excluded and rows short of k matches are padded with -1 / -inf.
+        """
+        rows = [row.to_dict() if isinstance(row, pd.Series) else dict(row) for row in rfq_rows]
+        idx = np.full((len(rows), k), -1, dtype=np.int64)
+        vals = np.full((len(rows), k), -np.inf)
+        if not rows:
+            return idx, vals
+        encoded = [self.encode(row) for row in rows]
+        queries = {key: np.stack([e[key] for e in encoded]) for key in encoded[0]}
+        # (query, index row) cells excluded as self matches
+        excluded = [(q, pos) for q, row in enumerate(rows) if pd.notna(row.get('id'))
+                    for pos in self._positions(str(row['id']))]
+        excl_q, excl_pos = (np.array(a, dtype=np.int64) for a in zip(*excluded)) if excluded \
+            else (np.empty(0, dtype=np.int64),) * 2
+
+        step = max(1, QUERY_TILE_CELLS // len(rows))
+        for lo in range(0, len(self), step):
+            hi = min(lo + step, len(self))
+            scores = rfq_engine.score_query(queries, self.arrays, mode, weights, slice(lo, hi))
+            inside = (excl_pos >= lo) & (excl_pos < hi)
+            scores[excl_q[inside], excl_pos[inside] - lo] = -np.inf
+            tile_idx, tile_vals = rfq_engine.top_k_rows(scores, k, np.arange(lo, hi))
+            idx, vals = rfq_engine.merge_top_k(idx, vals, tile_idx, tile_vals, k)
+        return idx, vals
+
+    def query(self, rfq_row, k=3, mode="all", weights=None):
+        """Top-k indexed RFQs for one raw RFQ, as ``rfq_id, match_id, similarity_score`` rows."""
+        row = rfq_row.to_dict() if isinstance(rfq_row, pd.Series) else dict(rfq_row)
+        idx, vals = self.search([row], k, mode, weights)
+        valid = idx[0] >= 0
+        return pd.DataFrame({
+            'rfq_id': row.get('id'),
+            'match_id': np.asarray(self.ids[idx[0][valid]], dtype=object),
+            'similarity_score': vals[0][valid],
+        })
+
+# ---------- benchmark ----------
+def benchmark_queries(index_dir, queries, k=3):
+    """Load time and per-query latency (ms) of a saved index over ``queries`` (a raw RFQ frame)."""
+    start = time.perf_counter()
+    index = SimilarityIndex.load(index_dir)
+    load_seconds = time.perf_counter() - start
+    latencies = []
+    for _, row in queries.iterrows():
+        start = time.perf_counter()
+        index.query(row, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.asarray(latencies)
+    return {"indexed_rows": len(index), "load_seconds": load_seconds, "queries": len(latencies),
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p95": float(np.percentile(latencies, 95)),
+            "latency_ms_max": float(latencies.max())}
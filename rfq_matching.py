@@ -0,0 +1,264 @@
+# rfq_matching.py
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import rfq_engine
+import rfq_final
+import rfq_grades
+
+# Inventory columns that carry the dimensions RFQs ask for, in index order
+MATCH_DIMS = [('thickness', 'thickness_mm'), ('width', 'width_mm')]
+# Measured supplier values that override reference midpoints when present
+MEASURED_GRADE_COLS = {'tensile_mid': 'rm', 'yield_mid': 'rp02'}
+# Candidate pairs materialized at once while matching
+MATCH_BUDGET = 5_000_000
+
+# ---------- normalization ----------
+def normalize_grade(values):
+    return pd.Series(values, dtype=object).astype("string").str.upper().str.strip()
+
+def bucket_grade(grades, values):
+    """Bucket grade of each value: its reference grade in ``grades`` (a GradeIndex), else its normalized spelling.
+
+    RFQs and lots resolve through the same index, so ``S355-J2`` stock meets an
+    ``S355J2`` request; grades the reference does not know still meet by spelling.
+    """
+    normalized = normalize_grade(values)
+    resolved = grades.resolve_series(pd.Series(values, dtype=object).to_numpy()).astype("string")
+    return resolved.set_axis(normalized.index).fillna(normalized)
+
+def normalize_coating(values):
+    """Upper-case coating without the leading '+', so RFQ ``Z140`` meets stock ``+Z140``."""
+    coat = pd.Series(values, dtype=object).astype("string").str.upper().str.strip().str.lstrip("+")
+    return coat.mask(coat == "")
+
+# ---------- index ----------
+def _sorted_bucket(rows, dims, grade_mid):
+    """Bucket rows sorted by each match dimension, plus rows grouped by grade profile.
+
+    The grade-profile groups serve RFQs without any dimension range: their score
+    only depends on the lot's grade midpoints, so the first lots of each distinct
+    profile are the only candidates that can reach the top-k.
+    """
+    bucket = {"rows": rows, "by_dim": []}
+    for d in range(dims.shape[1]):
+        order = rows[np.argsort(dims[rows, d], kind='stable')]
+        values = dims[order, d]
+        bucket["by_dim"].append((order, values, int(np.count_nonzero(~np.isnan(values)))))
+    mids = grade_mid[rows]
+    signature = np.column_stack([np.where(np.isnan(mids), 0.0, mids), np.isnan(mids)])
+    _, profile = np.unique(signature, axis=0, return_inverse=True)
+    profile = profile.ravel()
+    order = np.lexsort((rows, profile))
+    bucket["profile_rows"] = rows[order]
+    bucket["profile_starts"] = np.flatnonzero(np.r_[True, np.diff(profile[order]) != 0])
+    return bucket
+
+def build_inventory_index(inventory, reference_path="data/reference_properties.tsv", include_reserved=False):
+    """Index cleaned inventory for RFQ range lookups.
+
+    Lots are hashed on (grade, coating) and on grade alone, with grades resolved
+    to reference grades where possible (see bucket_grade); every bucket
+    keeps its rows sorted by ``thickness_mm`` and by ``width_mm`` so a requested
+    range is a ``searchsorted`` slice. Reserved lots are dropped unless ``include_reserved``.
+    Grade midpoints come from the lot's resolved reference grade (rfq_grades),
+    overridden by measured rm/rp02.
+    """
+    inv = inventory.reset_index(drop=True)
+    reserved = pd.to_numeric(inv.get("reserved"), errors="coerce") if "reserved" in inv.columns else None
+    available = np.ones(len(inv), dtype=bool) if include_reserved or reserved is None \
+        else ~(reserved.fillna(0).to_numpy() > 0)
+
+    coating = normalize_coating(inv["coating"]) if "coating" in inv.columns else pd.Series(pd.NA, index=inv.index)
+
+    table, _ = rfq_final.load_grade_table(reference_path)
+    mids = table.drop_duplicates('Grade/Material').set_index('Grade/Material')[rfq_engine.GRADE_MID_COLS]
+    # Lots take the properties of their resolved reference grade (see rfq_grades)
+    grades = rfq_grades.grade_index(mids.index.tolist())
+    reference_grade = grades.resolve_series(inv["grade"])
+    grade = bucket_grade(grades, inv["grade"])
+    grade_mid = mids.reindex(reference_grade.to_numpy(dtype=object)).to_numpy(dtype=np.float64)
+    for c, col in enumerate(rfq_engine.GRADE_MID_COLS):
+        measured = MEASURED_GRADE_COLS.get(col)
+        if measured in inv.columns:
+            values = pd.to_numeric(inv[measured], errors="coerce").to_numpy(dtype=np.float64)
+            grade_mid[:, c] = np.where(values > 0, values, grade_mid[:, c])
+
+    dims = np.column_stack([pd.to_numeric(inv[col], errors="coerce").to_numpy(dtype=np.float64)
+                            for _, col in MATCH_DIMS])
+
+    by_key, by_grade = {}, {}
+    keyed = pd.DataFrame({"grade": grade, "coating": coating})[available]
+    for g, group in keyed.groupby("grade", sort=False):
+        by_grade[g] = _sorted_bucket(group.index.to_numpy(), dims, grade_mid)
+        for c, sub in group.dropna(subset=["coating"]).groupby("coating", sort=False):
+            by_key[(g, c)] = _sorted_bucket(sub.index.to_numpy(), dims, grade_mid)
+
+    return {"inventory": inv, "grades": grades, "dims": dims, "grade_mid": grade_mid,
+            "coating": coating.to_numpy(dtype=object), "by_key": by_key, "by_grade": by_grade}
+
+# ---------- matching ----------
+def _relative_closeness(a, b):
+    """1 - |a - b| / max(a, b), 0 when missing or non-positive (the grade term of compute_top3_similarity)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vmax = np.maximum(a, b)
+        return np.where(vmax > 0, 1 - np.abs(a - b) / vmax, 0.0)
+
+def _slice_counts(bucket, d, lo, hi):
+    """Start and length of each query's range slice on dimension ``d`` of a bucket."""
+    order, values, n_valid = bucket["by_dim"][d]
+    start = np.searchsorted(values[:n_valid], lo, side='left')
+    stop = np.searchsorted(values[:n_valid], hi, side='right')
+    return start, np.maximum(stop - start, 0)
+
+def _expand(order, start, counts):
+    """Flatten per-query slices ``order[start:start+count]`` into (query, lot) pairs."""
+    q = np.repeat(np.arange(len(start)), counts)
+    pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+    return q, order[pos]
+
+def _candidates(bucket, q_lo, q_hi, k):
+    """(query, lot) candidate pairs for a batch of RFQs against one bucket.
+
+    Each RFQ slices the bucket on whichever requested dimension gives fewer lots;
+    RFQs without any range get the first k lots of every grade profile.
+    """
+    requested = ~np.isnan(q_lo) & ~np.isnan(q_hi)
+    counts = np.full(q_lo.shape, np.iinfo(np.int64).max)
+    starts = np.zeros(q_lo.shape, dtype=np.int64)
+    for d in range(q_lo.shape[1]):
+        r = requested[:, d]
+        starts[r, d], counts[r, d] = _slice_counts(bucket, d, q_lo[r, d], q_hi[r, d])
+    best = np.argmin(counts, axis=1)
+
+    qs, lots = [], []
+    for d in range(q_lo.shape[1]):
+        sel = np.flatnonzero(requested.any(axis=1) & (best == d))
+        q, lot = _expand(bucket["by_dim"][d][0], starts[sel, d], counts[sel, d])
+        qs.append(sel[q])
+        lots.append(lot)
+
+    open_q = np.flatnonzero(~requested.any(axis=1))
+    if len(open_q):
+        rows, starts_p = bucket["profile_rows"], bucket["profile_starts"]
+        ends_p = np.r_[starts_p[1:], len(rows)]
+        firsts = np.concatenate([rows[s:min(s + k, e)] for s, e in zip(starts_p, ends_p)])
+        qs.append(np.repeat(open_q, len(firsts)))
+        lots.append(np.tile(firsts, len(open_q)))
+    return np.concatenate(qs), np.concatenate(lots)
+
+def _estimate(bucket, q_lo, q_hi, k):
+    """Candidate count per RFQ, used to size batches."""
+    requested = ~np.isnan(q_lo) & ~np.isnan(q_hi)
+    est = np.full(len(q_lo), len(bucket["profile_starts"]) * k, dtype=np.int64)
+    counts = np.full(q_lo.shape, np.iinfo(np.int64).max)
+    for d in range(q_lo.shape[1]):
+        r = requested[:, d]
+        counts[r, d] = _slice_counts(bucket, d, q_lo[r, d], q_hi[r, d])[1]
+    any_r = requested.any(axis=1)
+    est[any_r] = counts[any_r].min(axis=1)
+    return est
+
+def _match_bucket(index, bucket, q_lo, q_hi, q_grade, q_has_coat, k, weights):
+    """Top-k lots of one bucket for a batch of RFQs; returns (query, lot, score) arrays."""
+    q, lot = _candidates(bucket, q_lo, q_hi, k)
+
+    # Every requested dimension filters on its range and scores the lot value's
+    # closeness to the requested midpoint
+    keep = np.ones(len(lot), dtype=bool)
+    dim_sum, dim_n = np.zeros(len(lot)), np.zeros(len(lot))
+    for d in range(len(MATCH_DIMS)):
+        lo, hi, v = q_lo[q, d], q_hi[q, d], index["dims"][lot, d]
+        requested = ~np.isnan(lo) & ~np.isnan(hi)
+        keep &= ~requested | ((v >= lo) & (v <= hi))
+        dim_sum += np.where(requested, _relative_closeness(v, (lo + hi) / 2), 0.0)
+        dim_n += requested
+    q, lot, dim_sum, dim_n = q[keep], lot[keep], dim_sum[keep], dim_n[keep]
+    dim_sim = np.where(dim_n > 0, dim_sum / np.maximum(dim_n, 1), 0.0)
+
+    grade_sim = np.zeros(len(lot))
+    for g in range(q_grade.shape[1]):
+        grade_sim += _relative_closeness(q_grade[q, g], index["grade_mid"][lot, g])
+    grade_sim /= q_grade.shape[1]
+
+    # Grade always matches inside a bucket; coating matches when the RFQ named one
+    cat_sim = (1 + q_has_coat[q]) / 2
+    score = weights["dim"]*dim_sim + weights["cat"]*cat_sim + weights["grade"]*grade_sim
+
+    order = np.lexsort((lot, -score, q))
+    q, lot, score = q[order], lot[order], score[order]
+    rank = np.arange(len(q)) - np.searchsorted(q, q, side='left')
+    top = rank < k
+    return q[top], lot[top], score[top]
+
+def match_rfqs(rfq_enriched, index, k=3, weights=None, budget=MATCH_BUDGET):
+    """Top-k available stock lots per RFQ without a cross join.
+
+    RFQs are grouped by their (grade, coating) bucket (grade only when no coating is
+    requested), with grades resolved through the index's GradeIndex as for the
+    lots, and each lookup is a thickness or width slice of that bucket.
+    Batches are sized so about ``budget`` candidate pairs exist at once.
+    Returns rfq_id, lot (inventory row), the lot's key columns and match_score.
+    """
+    weights = weights if weights else rfq_engine.DEFAULT_WEIGHTS
+    packed = rfq_engine.pack_features(rfq_enriched)
+    dim_pos = [rfq_engine.DIM_COLS.index(d) for d, _ in MATCH_DIMS]
+    q_lo, q_hi = packed["dim_min"][:, dim_pos], packed["dim_max"][:, dim_pos]
+    grade = bucket_grade(index["grades"], rfq_enriched["grade"]).to_numpy(dtype=object)
+    coating = normalize_coating(rfq_enriched["coating"]).to_numpy(dtype=object) \
+        if "coating" in rfq_enriched.columns else np.full(len(rfq_enriched), pd.NA, dtype=object)
+    has_coat = ~pd.isna(coating)
+
+    keys = pd.DataFrame({"grade": grade, "coating": coating})
+    out_q, out_lot, out_score = [], [], []
+    for (g, c), group in keys.groupby(["grade", "coating"], dropna=False, sort=False):
+        if pd.isna(g):
+            continue
+        bucket = index["by_grade"].get(g) if pd.isna(c) else index["by_key"].get((g, c))
+        if bucket is None:
+            continue
+        qs = group.index.to_numpy()
+        est = _estimate(bucket, q_lo[qs], q_hi[qs], k)
+        batch_id = np.cumsum(np.maximum(est, 1)) // max(budget, 1)
+        for b in np.unique(batch_id):
+            sel = qs[batch_id == b]
+            q, lot, score = _match_bucket(index, bucket, q_lo[sel], q_hi[sel], packed["grade_mid"][sel],
+                                          has_coat[sel], k, weights)
+            out_q.append(sel[q])
+            out_lot.append(lot)
+            out_score.append(score)
+
+    q = np.concatenate(out_q) if out_q else np.empty(0, dtype=np.int64)
+    lot = np.concatenate(out_lot) if out_lot else np.empty(0, dtype=np.int64)
+    score = np.concatenate(out_score) if out_score else np.empty(0)
+    order = np.lexsort((lot, -score, q))
+    q, lot, score = q[order], lot[order], score[order]
+
+    inv = index["inventory"]
+    cols = [c for c in ["article_id", "source", "grade", "coating", "thickness_mm", "width_mm", "weight_kg"]
+            if c in inv.columns]
+    result = inv.iloc[lot][cols].reset_index(drop=True)
+    result.insert(0, "lot", lot)
+    result.insert(0, "rfq_id", packed["ids"][q])
+    result["match_score"] = score
+    return result
+
+# ---------- run ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match RFQs to available inventory lots.")
+    parser.add_argument("--rfq", default="data/rfq.csv")
+    parser.add_argument("--reference", default="data/reference_properties.tsv")
+    parser.add_argument("--inventory", default="outputs/inventory_dataset.csv")
+    parser.add_argument("--output", default="outputs/rfq_inventory_matches.csv")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--include-reserved", action="store_true")
+    args = parser.parse_args()
+
+    import rfq_store
+    rfq_enriched = rfq_store.load_or_enrich(args.rfq, args.reference, "outputs/rfq_enriched_store")
+    index = build_inventory_index(pd.read_csv(args.inventory), args.reference, args.include_reserved)
+    matches = match_rfqs(rfq_enriched, index, k=args.k)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    matches.to_csv(args.output, index=False)
+    print(f"[OK] {matches['rfq_id'].nunique()} RFQs matched, {len(matches)} rows saved to {args.output}")
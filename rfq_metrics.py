@@ -0,0 +1,75 @@
+# rfq_metrics.py
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then reported as None
+    resource = None
+
+# ---------- helpers ----------
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# ---------- recorder ----------
+class StageMetrics:
+    """Collects wall time, CPU time, memory and throughput for named pipeline stages.
+
+    ``profile_dir`` writes one cProfile dump per stage (``<stage>.prof``, readable
+    with ``python -m pstats`` or snakeviz). ``trace_memory`` adds the tracemalloc
+    peak of each stage, which is exact per stage but slows allocation-heavy code.
+    """
+
+    def __init__(self, profile_dir=None, trace_memory=False):
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows=None, pairs=None):
+        """Time the enclosed block. The yielded dict accepts ``rows``/``pairs`` set inside it."""
+        record = {"stage": name, "rows": rows, "pairs": pairs}
+        profiler = cProfile.Profile() if self.profile_dir else None
+        if self.trace_memory:
+            tracemalloc.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            record.update({"wall_seconds": wall, "cpu_seconds": cpu, "peak_rss_mb": peak_rss_mb()})
+            if self.trace_memory:
+                record["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+            if record["rows"] is not None:
+                record["rows_per_second"] = record["rows"] / wall if wall > 0 else None
+            if record["pairs"] is not None:
+                record["pairs_per_second"] = record["pairs"] / wall if wall > 0 else None
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record["profile"] = os.path.join(self.profile_dir, f"{name}.prof")
+                profiler.dump_stats(record["profile"])
+            self.stages.append(record)
+
+    def report(self):
+        return {"stages": self.stages,
+                "total_wall_seconds": sum(s["wall_seconds"] for s in self.stages)}
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
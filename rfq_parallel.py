@@ -0,0 +1,79 @@
+# rfq_parallel.py
+import numpy as np
+import os
+from multiprocessing import get_context, resource_tracker, shared_memory
+
+# Arrays attached by each pool worker, keyed like the packed feature dict
+_WORKER_ARRAYS = {}
+_WORKER_BLOCKS = []
+
+# ---------- shared memory ----------
+def share_arrays(arrays):
+    """Copy numeric arrays into shared memory blocks.
+
+    Returns (blocks, spec); ``spec`` is the small picklable description workers
+    use to attach. The caller owns the blocks and must close and unlink them.
+    """
+    blocks, spec = [], {}
+    for key, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[...] = arr
+        blocks.append(block)
+        spec[key] = (block.name, arr.shape, arr.dtype.str)
+    return blocks, spec
+
+def attach_arrays(spec):
+    """Attach to blocks created by share_arrays without copying; returns (blocks, arrays)."""
+    blocks, arrays = [], {}
+    for key, (name, shape, dtype) in spec.items():
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers every attach with the resource tracker; skip
+            # that so only the creating process tracks and unlinks the block
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args: None
+            try:
+                block = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+def _init_worker(spec):
+    blocks, arrays = attach_arrays(spec)
+    _WORKER_BLOCKS.extend(blocks)
+    _WORKER_ARRAYS.update(arrays)
+
+def _run_task(task):
+    func, start, stop, options = task
+    return func(_WORKER_ARRAYS, start, stop, **options)
+
+# ---------- pool ----------
+def parallel_top_k(arrays, func, n_rows, workers=None, chunk_size=None, **options):
+    """Run ``func(arrays, start, stop, **options)`` over row ranges in a process pool.
+
+    ``func`` must be a module-level function returning (indices, values) for its
+    rows. Ranges are merged back in row order, and every row's top-k only depends
+    on its own scores with ties broken by global index, so the result does not
+    depend on the number of workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, -(-n_rows // (workers * 4)))
+    tasks = [(func, lo, min(lo + chunk_size, n_rows), options) for lo in range(0, n_rows, chunk_size)]
+
+    blocks, spec = share_arrays(arrays)
+    try:
+        with get_context().Pool(workers, initializer=_init_worker, initargs=(spec,)) as pool:
+            parts = pool.map(_run_task, tasks)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    k = options.get("k", 3)
+    if not parts:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k))
+    return np.vstack([p[0] for p in parts]), np.vstack([p[1] for p in parts])
@@ -0,0 +1,376 @@
+# rfq_service.py
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import rfq_lookup
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Micro-batching: requests arriving within the window after the first waiting one
+# are scored together, up to MAX_BATCH of them
+BATCH_WINDOW_MS = 1.0
+MAX_BATCH = 64
+# Backpressure: requests waiting service-wide (beyond this a request is rejected
+# at once) and requests in flight per connection (beyond this the connection is
+# not read, so TCP flow control slows the client down)
+MAX_PENDING = 1024
+MAX_INFLIGHT_PER_CONNECTION = 128
+MAX_K = 100
+MAX_LINE_BYTES = 1 << 20
+# RFQ field values a request may carry (None for missing)
+SCALAR_TYPES = (str, int, float, bool, np.number)
+
+class ServiceError(Exception):
+    """Error reply from the match service."""
+
+class ServiceOverloaded(ServiceError):
+    """The service has MAX_PENDING requests waiting; retry later."""
+
+def check_rfq(rfq):
+    """Raise ServiceError unless ``rfq`` is an object of scalar field values."""
+    if not isinstance(rfq, dict):
+        raise ServiceError("missing 'rfq' object")
+    bad = [str(key) for key, value in rfq.items() if value is not None and not isinstance(value, SCALAR_TYPES)]
+    if bad:
+        raise ServiceError(f"non-scalar values for {', '.join(bad)}")
+
+def _jsonable(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+# ---------- server ----------
+class MatchService:
+    """Top-k RFQ matches over a SimilarityIndex kept in memory, with micro-batching.
+
+    Concurrent requests are queued. The first waiting request opens a window of
+    ``window_ms``, and everything that arrives in it (up to ``max_batch``) is
+    scored by one ``SimilarityIndex.search`` call in a worker thread while the
+    event loop keeps reading sockets. Results equal ``index.query`` one by one.
+
+    Protocol: one JSON object per line, ``{"tag": any, "rfq": {rfq.csv fields}, "k": 3}``
+    answered by ``{"tag": ..., "matches": [{"match_id": ..., "similarity_score": ...}]}``
+    or ``{"tag": ..., "error": ...}`` (``bad_request``, ``overloaded`` or ``internal``).
+    Every request gets exactly one reply; replies on a connection may come out of order.
+    RFQ fields must be scalars, and a request that fails scoring is retried alone so
+    it never fails the rest of its batch.
+    """
+
+    def __init__(self, index, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH, max_pending=MAX_PENDING):
+        self.index = index
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.stats = {"requests": 0, "batches": 0, "rejected": 0}
+        self._queue = None
+        self._batcher_task = None
+
+    async def match(self, rfq, k=3):
+        """Top-k ``(match_id, similarity_score)`` pairs for one raw RFQ."""
+        # Rejected before queueing, so a malformed request never reaches a batch
+        check_rfq(rfq)
+        if self._queue.full():
+            self.stats["rejected"] += 1
+            raise ServiceOverloaded(f"{self.max_pending} requests pending")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((rfq, k, future))
+        return await future
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            try:
+                await self._score(batch)
+            except Exception as exc:
+                # Never let one batch stop the batcher; its requests get the error
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    async def _score(self, batch):
+        # One search at the largest k; a shorter list is a prefix of it
+        k = max(item[1] for item in batch)
+        try:
+            idx, vals = await asyncio.get_running_loop().run_in_executor(
+                None, self.index.search, [item[0] for item in batch], k)
+        except Exception as exc:
+            if len(batch) > 1:
+                # Score the requests one by one, so a failing one only fails itself
+                for item in batch:
+                    await self._score([item])
+                return
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        for i, (_, k_i, future) in enumerate(batch):
+            if future.done():
+                continue
+            keep = idx[i, :k_i] >= 0
+            future.set_result(list(zip(self.index.ids[idx[i, :k_i][keep]].tolist(),
+                                       vals[i, :k_i][keep].tolist())))
+
+    async def _answer(self, line):
+        tag = None
+        try:
+            request = json.loads(line)
+            tag = request.get("tag")
+            k = request.get("k", 3)
+            # bool is an int subclass, but "k": true is not a count
+            if isinstance(k, bool) or not isinstance(k, int) or not 0 < k <= MAX_K:
+                raise ServiceError(f"k must be an integer in 1..{MAX_K}")
+            matches = await self.match(request.get("rfq"), k)
+            return {"tag": tag, "matches": [{"match_id": m, "similarity_score": s} for m, s in matches]}
+        except ServiceOverloaded as exc:
+            return {"tag": tag, "error": "overloaded", "detail": str(exc)}
+        except (ValueError, TypeError, AttributeError, ServiceError) as exc:
+            return {"tag": tag, "error": "bad_request", "detail": str(exc)}
+        except Exception as exc:
+            return {"tag": tag, "error": "internal", "detail": f"{type(exc).__name__}: {exc}"}
+
+    async def _reply(self, line, writer, slots):
+        # The slot is held until the reply is flushed, so a slow reader is throttled too.
+        # Every request gets exactly one reply line, whatever went wrong
+        try:
+            try:
+                reply = json.dumps(await self._answer(line), default=_jsonable)
+            except Exception as exc:
+                reply = json.dumps({"tag": None, "error": "internal", "detail": f"{type(exc).__name__}: {exc}"})
+            writer.write(reply.encode() + b"\n")
+            await writer.drain()
+        finally:
+            slots.release()
+
+    async def handle(self, reader, writer):
+        """Serve one connection; requests on it are answered concurrently."""
+        slots = asyncio.Semaphore(MAX_INFLIGHT_PER_CONNECTION)
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._reply(line, writer, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):
+            # ValueError: a line longer than MAX_LINE_BYTES
+            pass
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        """Start the batcher and listen on ``path`` (Unix socket) or ``host:port``; returns the server."""
+        self._queue = asyncio.Queue(self.max_pending)
+        self._batcher_task = asyncio.create_task(self._batcher())
+        if path:
+            return await asyncio.start_unix_server(self.handle, path, limit=MAX_LINE_BYTES)
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_LINE_BYTES)
+
+    async def stop(self, server):
+        server.close()
+        await server.wait_closed()
+        self._batcher_task.cancel()
+
+def open_index(index_dir, rfq_path="data/rfq.csv", reference_path="data/reference_properties.tsv",
+               store_dir="outputs/rfq_enriched_store", cache_dir="outputs/cache"):
+    """Load the saved index into memory, building it from the enriched RFQs first if missing."""
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        import rfq_store
+        rfq_enriched = rfq_store.load_or_enrich(rfq_path, reference_path, store_dir, cache_dir=cache_dir)
+        rfq_lookup.SimilarityIndex.build(rfq_enriched, reference_path, cache_dir).save(index_dir)
+    return rfq_lookup.SimilarityIndex.load(index_dir, mmap=False)
+
+async def serve_forever(index, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, **options):
+    service = MatchService(index, **options)
+    server = await service.start(host, port, path)
+    print(f"[OK] Serving {len(index)} RFQs on {path or f'{host}:{port}'}")
+    async with server:
+        await server.serve_forever()
+
+def serve(index, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, **options):
+    """Run the service until interrupted."""
+    asyncio.run(serve_forever(index, host, port, path, **options))
+
+# ---------- client ----------
+class MatchClient:
+    """Client for MatchService; concurrent ``match`` calls are pipelined over one connection."""
+
+    def __init__(self, reader, writer):
+        self._reader, self._writer = reader, writer
+        self._pending = {}
+        self._tags = itertools.count()
+        self._read_task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path, limit=MAX_LINE_BYTES)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_BYTES)
+        return cls(reader, writer)
+
+    async def _read_replies(self):
+        error = ConnectionError("connection closed")
+        try:
+            while line := await self._reader.readline():
+                reply = json.loads(line)
+                future = self._pending.pop(reply.get("tag"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in reply:
+                    kind = ServiceOverloaded if reply["error"] == "overloaded" else ServiceError
+                    future.set_exception(kind(reply.get("detail", reply["error"])))
+                else:
+                    future.set_result(reply["matches"])
+        except (ConnectionError, ValueError) as exc:
+            error = exc
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def match(self, rfq, k=3):
+        """Top-k matches for one raw RFQ (dict or Series) as ``match_id``/``similarity_score`` dicts."""
+        row = rfq.to_dict() if isinstance(rfq, pd.Series) else dict(rfq)
+        row = {key: value for key, value in row.items() if not (np.isscalar(value) and pd.isna(value))}
+        tag = next(self._tags)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = future
+        self._writer.write(json.dumps({"tag": tag, "rfq": row, "k": k}, default=_jsonable).encode() + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        self._writer.close()
+        await self._read_task
+
+def match(rfq, k=3, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    """Blocking one-off lookup against a running service."""
+    async def run():
+        client = await MatchClient.connect(host, port, path)
+        try:
+            return await client.match(rfq, k)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+# ---------- load generator ----------
+async def load_test(queries, requests=1000, concurrency=32, k=3, connections=4,
+                    host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    """Send ``requests`` lookups with ``concurrency`` in flight and report throughput and latency.
+
+    ``queries`` (a raw RFQ frame) is cycled. Rejected (overloaded) requests are
+    counted, not retried, and left out of the latency percentiles.
+    """
+    rows = [{key: value for key, value in row.items() if pd.notna(value)}
+            for row in queries.to_dict(orient="records")]
+    clients = [await MatchClient.connect(host, port, path) for _ in range(min(connections, concurrency))]
+    counter = itertools.count()
+    latencies, rejected = [], 0
+
+    async def worker(client):
+        nonlocal rejected
+        while (i := next(counter)) < requests:
+            start = time.perf_counter()
+            try:
+                await client.match(rows[i % len(rows)], k)
+            except ServiceOverloaded:
+                rejected += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(clients[w % len(clients)]) for w in range(concurrency)))
+    seconds = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    latencies = np.asarray(latencies) if latencies else np.full(1, np.nan)
+    return {"requests": requests, "concurrency": concurrency, "seconds": seconds,
+            "requests_per_second": (requests - rejected) / seconds, "rejected": rejected,
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p95": float(np.percentile(latencies, 95)),
+            "latency_ms_max": float(latencies.max())}
+
+async def benchmark_service(index, queries, requests=1000, concurrency=(1, 8, 32), k=3, **options):
+    """Load-test an in-process service (localhost TCP, free port) at each concurrency level.
+
+    Returns one record per level with ``batched`` True for the micro-batching
+    settings in ``options`` and False for the same service scoring one request
+    at a time (``max_batch=1``), which is the baseline.
+    """
+    results = []
+    for batched in (False, True):
+        service = MatchService(index, **(options if batched else {**options, "max_batch": 1}))
+        server = await service.start(DEFAULT_HOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        for level in concurrency:
+            before = dict(service.stats)
+            record = await load_test(queries, requests, level, k, port=port)
+            batches = service.stats["batches"] - before["batches"]
+            record.update(batched=batched, mean_batch=(service.stats["requests"] - before["requests"]) / max(batches, 1))
+            results.append(record)
+        await service.stop(server)
+    return results
+
+# ---------- CLI ----------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Micro-batching RFQ similarity service.")
+    parser.add_argument("command", choices=["serve", "query", "bench"])
+    parser.add_argument("--index", default="outputs/similarity_index")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out-dir", default="outputs")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=None, help="Unix socket path instead of TCP")
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rfq-id", default=None, help="query: id of an rfq.csv row to look up")
+    parser.add_argument("--requests", type=int, default=1000, help="bench: lookups per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    return parser
+
+def main(args):
+    rfq_path = os.path.join(args.data_dir, "rfq.csv")
+    options = {"window_ms": args.window_ms, "max_batch": args.max_batch, "max_pending": args.max_pending}
+    if args.command == "query":
+        rfq = pd.read_csv(rfq_path)
+        row = rfq[rfq["id"] == args.rfq_id].iloc[0] if args.rfq_id else rfq.iloc[0]
+        for m in match(row, args.k, args.host, args.port, args.socket):
+            print(f"{m['match_id']}  {m['similarity_score']:.6f}")
+        return
+    index = open_index(args.index, rfq_path, os.path.join(args.data_dir, "reference_properties.tsv"),
+                       os.path.join(args.out_dir, "rfq_enriched_store"), os.path.join(args.out_dir, "cache"))
+    if args.command == "serve":
+        serve(index, args.host, args.port, args.socket, **options)
+    else:
+        queries = pd.read_csv(rfq_path)
+        for r in asyncio.run(benchmark_service(index, queries, args.requests, args.concurrency, args.k, **options)):
+            print(f"{'batched' if r['batched'] else 'unbatched':9s} concurrency={r['concurrency']:3d} "
+                  f"{r['requests_per_second']:8.1f} req/s  p50={r['latency_ms_p50']:7.2f} ms  "
+                  f"p95={r['latency_ms_p95']:7.2f} ms  mean batch={r['mean_batch']:.1f}  rejected={r['rejected']}")
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
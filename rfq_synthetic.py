@@ -0,0 +1,85 @@
+# rfq_synthetic.py
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import uuid
+
+# Dimension pairs that are jittered together so min <= max still holds
+RFQ_DIM_PAIRS = [
+    ('thickness_min', 'thickness_max'), ('width_min', 'width_max'), ('length_min', None),
+    ('height_min', 'height_max'), ('weight_min', 'weight_max'),
+    ('inner_diameter_min', 'inner_diameter_max'), ('outer_diameter_min', 'outer_diameter_max'),
+]
+
+# ---------- helpers ----------
+def _uuids(rng, n):
+    raw = rng.integers(0, 2**63, size=(n, 2), dtype=np.int64).astype(np.uint64)
+    return [str(uuid.UUID(int=(int(hi) << 64) | int(lo), version=4)) for hi, lo in raw]
+
+def _jitter(rng, values, scale, share, decimals):
+    """Scale a random ``share`` of the non-null values by a lognormal factor."""
+    values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float).copy()
+    factor = np.where(rng.random(len(values)) < share, rng.lognormal(0.0, scale, len(values)), 1.0)
+    return np.round(values * factor, decimals), factor
+
+# ---------- generators ----------
+def generate_rfq(n, source="data/rfq.csv", seed=0):
+    """Sample ``n`` RFQs from the real file.
+
+    Whole rows are drawn with replacement, so the joint grade/form/coating/finish
+    distribution is preserved; dimension ranges of half the rows are rescaled so
+    large books do not collapse onto the ~1k distinct source rows. Ids are new UUIDs.
+    """
+    rng = np.random.default_rng(seed)
+    real = pd.read_csv(source)
+    rfq = real.iloc[rng.integers(0, len(real), n)].reset_index(drop=True)
+    for lo_col, hi_col in RFQ_DIM_PAIRS:
+        if lo_col not in rfq.columns:
+            continue
+        rfq[lo_col], factor = _jitter(rng, rfq[lo_col], 0.15, 0.5, 2)
+        if hi_col in rfq.columns:
+            rfq[hi_col] = np.round(pd.to_numeric(rfq[hi_col], errors='coerce').to_numpy(dtype=float) * factor, 2)
+    rfq['id'] = _uuids(rng, n)
+    return rfq
+
+def generate_supplier(n, source, seed=0):
+    """Sample ``n`` supplier rows from a real workbook, jittering the numeric columns."""
+    rng = np.random.default_rng(seed)
+    real = pd.read_excel(source)
+    sup = real.iloc[rng.integers(0, len(real), n)].reset_index(drop=True)
+    for col, decimals in [("Thickness (mm)", 2), ("Width (mm)", 0), ("Gross weight (kg)", 0), ("Weight (kg)", 0)]:
+        if col in sup.columns:
+            sup[col], _ = _jitter(rng, sup[col], 0.1, 0.5, decimals)
+    if "Article ID" in sup.columns:
+        sup["Article ID"] = 23000000 + rng.permutation(max(n, 1))[:n]
+    return sup
+
+def write_dataset(n, out_dir, seed=0, supplier_rows=None, data_dir="data"):
+    """Write rfq.csv and both supplier workbooks for one size; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    supplier_rows = n if supplier_rows is None else supplier_rows
+    paths = {
+        "rfq": os.path.join(out_dir, "rfq.csv"),
+        "supplier1": os.path.join(out_dir, "supplier_data1.xlsx"),
+        "supplier2": os.path.join(out_dir, "supplier_data2.xlsx"),
+    }
+    generate_rfq(n, os.path.join(data_dir, "rfq.csv"), seed).to_csv(paths["rfq"], index=False)
+    generate_supplier(supplier_rows, os.path.join(data_dir, "supplier_data1.xlsx"), seed + 1).to_excel(
+        paths["supplier1"], index=False, engine="openpyxl")
+    generate_supplier(supplier_rows, os.path.join(data_dir, "supplier_data2.xlsx"), seed + 2).to_excel(
+        paths["supplier2"], index=False, engine="openpyxl")
+    return paths
+
+# ---------- run ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic RFQ and supplier datasets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--out-dir", default="bench_data")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        out = os.path.join(args.out_dir, f"n{size}")
+        write_dataset(size, out, seed=args.seed)
+        print(f"[OK] wrote synthetic dataset with {size} rows to {out}")
@@ -0,0 +1,160 @@
+# rfq_topk.py
+import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
+import rfq_engine
+
+# Layout of a top-k directory: indices.npy (n x k match rows, -1 when missing),
+# scores.npy (n x k), ids.npy (row -> RFQ id dictionary, UTF-8 bytes) and meta.json, written last.
+TOPK_ARRAYS = ["indices", "scores", "ids"]
+# Query rows converted per CSV chunk
+CSV_CHUNK_ROWS = 100_000
+
+# ---------- writer ----------
+class TopKWriter:
+    """Stream top-k blocks into a compact, memory-mappable top-k directory.
+
+    Matches are stored as row numbers into the id dictionary (int32 while the
+    book fits) and scores as ``score_dtype`` (float32 by default; float64 keeps
+    the engine's scores bit for bit). Each block is written into preallocated
+    ``.npy`` memory maps as it arrives, so nothing per pair is kept in memory.
+    The directory only replaces ``path`` on ``close`` after every row is written.
+    """
+
+    def __init__(self, path, ids, k, score_dtype=np.float32, meta=None):
+        self.path = path.rstrip(os.sep)
+        self.tmp_dir = self.path + ".tmp"
+        self.n = len(ids)
+        self.k = k
+        self.meta = {"n_rows": self.n, "k": k, **(meta or {})}
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        # Fixed-width bytes: a third of the size of a numpy unicode array of UUIDs
+        np.save(os.path.join(self.tmp_dir, "ids.npy"), np.char.encode(np.asarray(ids).astype(str), "utf-8"))
+        index_dtype = np.int32 if self.n < np.iinfo(np.int32).max else np.int64
+        open_memmap = np.lib.format.open_memmap
+        self.indices = open_memmap(os.path.join(self.tmp_dir, "indices.npy"), mode="w+",
+                                   dtype=index_dtype, shape=(self.n, k))
+        self.scores = open_memmap(os.path.join(self.tmp_dir, "scores.npy"), mode="w+",
+                                  dtype=score_dtype, shape=(self.n, k))
+        self.written = np.zeros(self.n, dtype=bool)
+
+    def write(self, rows, idx, vals):
+        """Store the (indices, values) of query ``rows``; padding (-1 / -inf) is kept as is."""
+        self.indices[rows] = idx
+        self.scores[rows] = vals
+        self.written[rows] = True
+
+    def close(self):
+        if not self.written.all():
+            raise ValueError(f"{self.n - int(self.written.sum())} rows of {self.path} were never written")
+        self.indices.flush()
+        self.scores.flush()
+        del self.indices, self.scores
+        with open(os.path.join(self.tmp_dir, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_dir, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A failed run leaves the previous output in place and the partial one in .tmp
+        if exc_type is None:
+            self.close()
+
+def write_top_k(rfq_enriched, path, k=3, mode="all", weights=None, block_size=None,
+                col_block_size=None, engine="numpy", score_dtype=np.float32):
+    """Compute top-k block by block and stream it to the top-k directory ``path``.
+
+    engine="numpy" writes the blocks of ``rfq_engine.iter_top_k_blocks``,
+    engine="pruned" those of ``pruned_top_k_blocks``, and engine="dedupe" the
+    result of ``rfq_dedupe.packed_top_k``. Returns the number of query rows.
+    """
+    packed = rfq_engine.pack_features(rfq_enriched)
+    meta = {"mode": mode, "weights": weights, "engine": engine}
+    with TopKWriter(path, packed["ids"], k, score_dtype, meta) as writer:
+        if engine == "numpy":
+            blocks = rfq_engine.iter_top_k_blocks(packed, k, mode, weights, block_size,
+                                                  col_block_size=col_block_size)
+        elif engine == "pruned":
+            blocks = (block[:3] for block in rfq_engine.pruned_top_k_blocks(packed, k, mode, weights, block_size))
+        elif engine == "dedupe":
+            import rfq_dedupe
+            idx, vals, _ = rfq_dedupe.packed_top_k(packed, k, mode, weights, block_size)
+            blocks = [(np.arange(len(idx)), idx, vals)]
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+        for rows, idx, vals in blocks:
+            writer.write(rows, idx, vals)
+    return writer.n
+
+# ---------- reader ----------
+class TopKFile:
+    """Read side of a top-k directory; arrays are read-only memory maps with ``mmap=True``.
+
+    ``indices[i]`` and ``scores[i]`` are the matches of the RFQ ``ids[i]``, best
+    first, and ``-1`` marks a missing match.
+    """
+
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        mode = "r" if mmap else None
+        self.indices, self.scores, self.ids = (np.load(os.path.join(path, f"{key}.npy"), mmap_mode=mode)
+                                               for key in TOPK_ARRAYS)
+        self.k = self.meta["k"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def id_strings(self, rows):
+        """RFQ ids of dictionary ``rows`` as a Python-string object array."""
+        return np.char.decode(np.asarray(self.ids[rows]), "utf-8").astype(object)
+
+    def frame(self, rows=None):
+        """``rfq_id, match_id, similarity_score`` records for query ``rows`` (all by default)."""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        idx = np.asarray(self.indices[rows])
+        valid = idx >= 0
+        q = np.repeat(rows, valid.sum(axis=1))
+        return pd.DataFrame({
+            'rfq_id': self.id_strings(q),
+            'match_id': self.id_strings(idx[valid]),
+            'similarity_score': np.asarray(self.scores[rows])[valid],
+        })
+
+    def to_csv(self, out_path, chunk_rows=CSV_CHUNK_ROWS):
+        """Write the CSV layout of ``run.py``: sorted by rfq_id, then score descending.
+
+        Query rows are taken in id order, ``chunk_rows`` at a time, and a chunk never
+        splits an id, so the sort stays per chunk and memory stays bounded.
+        """
+        ids = np.asarray(self.ids)
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        tmp_path = out_path + ".tmp"
+        with open(tmp_path, "w", newline="") as f:
+            pd.DataFrame(columns=['rfq_id', 'match_id', 'similarity_score']).to_csv(f, index=False)
+            lo = 0
+            while lo < len(order):
+                hi = min(lo + chunk_rows, len(order))
+                if hi < len(order):
+                    hi = int(np.searchsorted(sorted_ids, sorted_ids[hi - 1], side='right'))
+                chunk = self.frame(order[lo:hi])
+                chunk.sort_values(by=['rfq_id', 'similarity_score'], ascending=[True, False]) \
+                    .to_csv(f, index=False, header=False)
+                lo = hi
+        os.replace(tmp_path, out_path)
+        return out_path
+
+def read_top_k(path, mmap=True):
+    """Open a top-k directory written by TopKWriter / write_top_k."""
+    return TopKFile(path, mmap)
+
+def convert_to_csv(path, out_path, chunk_rows=CSV_CHUNK_ROWS):
+    """Convert the top-k directory ``path`` to the ``top{k}.csv`` layout at ``out_path``."""
+    return read_top_k(path).to_csv(out_path, chunk_rows)
@@ -1,31 +1,114 @@
+import argparse
 import os
+import rfq_engine
 import rfq_final
+import rfq_incremental
+import rfq_store
+import rfq_topk
+from rfq_metrics import StageMetrics
+
+def main(write_csv=True, metrics_path=None, profile_dir=None, trace_memory=False,
+         data_folder="data", outputs_folder="outputs", k=3, weights=None, block_size=None, workers=None,
+         incremental=False, engine="numpy", dedupe=False, output_format="csv"):
+    if output_format == "binary" and (incremental or engine == "loop"):
+        raise ValueError("binary output streams numpy/pruned/dedupe blocks; use output_format='csv'")
+    if engine == "pruned":
+        rfq_engine.reject_options('engine="pruned"', workers=workers)
+    if dedupe:
+        if engine != "numpy":
+            raise ValueError(f"--dedupe needs --engine numpy, not {engine}")
+        rfq_engine.reject_options("--dedupe", workers=workers, incremental=incremental)
 
-def main():
     # Paths
-    data_folder = "data"
-    outputs_folder = "outputs"
     os.makedirs(outputs_folder, exist_ok=True)
 
     rfq_file = os.path.join(data_folder, "rfq.csv")
     reference_file = os.path.join(data_folder, "reference_properties.tsv")
 
+    cache_folder = os.path.join(outputs_folder, "cache")
+
+    store_path = os.path.join(outputs_folder, "rfq_enriched_store")
     enriched_path = os.path.join(outputs_folder, "rfq_enriched.csv")
-    top3_path = os.path.join(outputs_folder, "top3.csv")
+    top3_path = os.path.join(outputs_folder, f"top{k}.csv")
+    topk_dir = os.path.join(outputs_folder, f"top{k}.topk")
+    state_path = os.path.join(outputs_folder, "topk_state")
+
+    metrics = StageMetrics(profile_dir=profile_dir, trace_memory=trace_memory)
 
-    # Step 1: Enrich RFQ
-    rfq_enriched = rfq_final.enrich_rfq(rfq_file, reference_file)
-    rfq_enriched.to_csv(enriched_path, index=False)
-    print(f"Enriched RFQ saved to {enriched_path}")
+    # Step 1: Enrich RFQ (skipped when the typed store matches the input hashes)
+    with metrics.stage("enrichment") as stage:
+        rfq_enriched = rfq_store.load_or_enrich(rfq_file, reference_file, store_path, cache_dir=cache_folder)
+        stage["rows"] = len(rfq_enriched)
+    print(f"Enriched RFQ stored in {store_path}")
+    if write_csv:
+        with metrics.stage("write_enriched_csv", rows=len(rfq_enriched)):
+            rfq_enriched.to_csv(enriched_path, index=False)
+        print(f"Enriched RFQ saved to {enriched_path}")
 
-    # Step 2: Compute top-3 similarity
-    top3 = rfq_final.compute_top3_similarity(rfq_enriched)
-    top3_df_sorted = top3.sort_values(by=['rfq_id', 'similarity_score'], ascending=[True, False])
-    top3_df_sorted.reset_index(drop=True, inplace=True)
+    # Step 2: Compute top-k similarity
+    if output_format == "binary":
+        # Blocks go straight to indices/scores memory maps: no frame, no sort, no id strings per pair
+        with metrics.stage("similarity", rows=len(rfq_enriched), pairs=len(rfq_enriched) ** 2):
+            rfq_topk.write_top_k(rfq_enriched, topk_dir, k=k, weights=weights, block_size=block_size,
+                                 engine="dedupe" if dedupe and engine == "numpy" else engine)
+        print(f"Top-{k} similarity saved to {topk_dir} (rfq_topk.convert_to_csv gives the CSV layout)")
+        return _finish(metrics, metrics_path)
+
+    with metrics.stage("similarity", rows=len(rfq_enriched), pairs=len(rfq_enriched) ** 2) as stage:
+        if incremental:
+            # Only new/changed RFQs are scored against the book; state is kept in topk_state/
+            top3, stats = rfq_incremental.incremental_top_k(rfq_enriched, state_path, k=k, weights=weights,
+                                                            block_size=block_size)
+            stage["pairs"] = stats["rescored"] * len(rfq_enriched)
+            print(f"Incremental update: {stats}")
+        elif engine == "pruned":
+            top3, stats = rfq_engine.pruned_top_k(rfq_enriched, k=k, weights=weights, block_size=block_size,
+                                                  return_stats=True)
+            stage["pruning_rate"] = stats["pruning_rate"]
+            print(f"Bound pruning skipped {stats['pruning_rate']:.1%} of {stats['pairs']} candidate pairs")
+        elif dedupe and engine == "numpy":
+            import rfq_dedupe
+            top3, stats = rfq_dedupe.deduplicated_top_k(rfq_enriched, k=k, weights=weights, block_size=block_size,
+                                                        return_stats=True)
+            stage["unique_ratio"] = stats["unique_ratio"]
+            print(f"Deduplication: {stats['unique']} distinct feature rows of {stats['rows']} "
+                  f"({stats['unique_ratio']:.1%})")
+        else:
+            top3 = rfq_final.compute_top3_similarity(rfq_enriched, k=k, weights=weights,
+                                                     block_size=block_size, workers=workers, engine=engine)
+    with metrics.stage("sort", rows=len(top3)):
+        top3_df_sorted = top3.sort_values(by=['rfq_id', 'similarity_score'], ascending=[True, False])
+        top3_df_sorted.reset_index(drop=True, inplace=True)
 
     # Save to CSV
-    top3_df_sorted.to_csv(top3_path, index=False)
-    print(f"Top-3 similarity saved to {top3_path}")
+    with metrics.stage("write_top3_csv", rows=len(top3_df_sorted)):
+        top3_df_sorted.to_csv(top3_path, index=False)
+    print(f"Top-{k} similarity saved to {top3_path}")
+    return _finish(metrics, metrics_path)
+
+def _finish(metrics, metrics_path):
+    if metrics_path:
+        metrics.save(metrics_path)
+        print(f"Stage metrics saved to {metrics_path}")
+    return metrics.report()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Enrich RFQs and compute top-k similarity.")
+    parser.add_argument("--no-csv", action="store_true", help="skip the rfq_enriched.csv export")
+    parser.add_argument("--metrics", default=None, help="write per-stage JSON metrics to this path")
+    parser.add_argument("--profile-dir", default=None, help="write a cProfile dump per stage here")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record exact per-stage peak allocations with tracemalloc (slower)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="rescore only RFQs added/changed since the last --incremental run")
+    parser.add_argument("--engine", choices=["numpy", "pruned", "loop"], default="numpy",
+                        help="pruned: exact top-k that skips candidates by score upper bound")
+    parser.add_argument("--k", type=int, default=3, help="matches kept per RFQ")
+    parser.add_argument("--format", choices=["csv", "binary"], default="csv",
+                        help="binary: stream top-k to outputs/top{k}.topk (int32 indices, float32 scores)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="score each distinct feature row once (numpy engine)")
+    args = parser.parse_args()
+    main(write_csv=not args.no_csv, metrics_path=args.metrics, profile_dir=args.profile_dir,
+         trace_memory=args.trace_memory, incremental=args.incremental, engine=args.engine,
+         dedupe=args.dedupe, k=args.k, output_format=args.format)
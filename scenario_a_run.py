@@ -1,38 +1,65 @@
 import pandas as pd
 import numpy as np
+import argparse
+import os
 import re
+import shutil
+import sqlite3
+import tempfile
+from multiprocessing import get_context
 
 # ---------- helpers ----------
-def to_float(x):
-    if pd.isna(x):
-        return np.nan
-    if isinstance(x, (int, float, np.floating)):
-        return float(x)
-    s = str(x).strip()
-    if not s:
-        return np.nan
-    s = s.replace(",", ".")  # handle comma decimals
-    try:
-        return float(s)
-    except ValueError:
-        return np.nan
-
-def extract_grade_and_coating(material: str):
-    if pd.isna(material):
-        return (np.nan, np.nan)
-    s = str(material).strip().upper()
-    # Base grade (DX..., S..., HDC...)
-    m = re.search(r"(DX[0-9A-Z]+D?|S[0-9]+JR|HDC)", s)
-    base = m.group(1) if m else s.split()[0]
-    # Coating (e.g. +Z140, +AZ150)
-    plus = re.findall(r"\+[A-Z0-9]+", s)
-    coat = plus[0] if plus else np.nan
-    return (base, coat)
+# Base grade (DX..., S..., HDC...) and first "+..." coating (e.g. +Z140, +AZ150), both
+# at their leftmost position, in one pass
+GRADE_COATING_RE = re.compile(
+    r"(?s)^(?:(?=.*?(?P<base>DX[0-9A-Z]+D?|S[0-9]+JR|HDC)))?(?:(?=.*?(?P<coat>\+[A-Z0-9]+)))?"
+)
+
+def map_unique(values: pd.Series, func) -> pd.DataFrame:
+    """Apply a columnar ``func`` to the distinct values only and broadcast back.
+
+    Supplier columns repeat heavily, so this does the string work once per value.
+    ``func`` takes a Series of uniques (NaN included) and returns a Series or DataFrame.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    result = func(pd.Series(uniques, dtype=object))
+    taken = result.iloc[codes]
+    taken.index = values.index
+    return taken
+
+def to_float_series(values: pd.Series) -> pd.Series:
+    """Float column: comma decimals become dots, anything unparsable becomes NaN."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    def parse(u):
+        text = u.map(lambda x: x if isinstance(x, str) else np.nan)
+        text = text.str.strip().str.replace(",", ".", regex=False)
+        numbers = pd.to_numeric(u.map(lambda x: np.nan if isinstance(x, str) else x), errors="coerce")
+        return pd.to_numeric(text, errors="coerce").fillna(numbers).astype(float)
+    return map_unique(values, parse)
+
+def grade_and_coating_series(material: pd.Series, grades=None):
+    """Base grade and first coating of each material: returns (base grade, coating) Series.
+
+    With ``grades`` (an rfq_grades.GradeIndex) the base grade is the reference grade
+    the material resolves to, and the regex only covers materials it cannot resolve.
+    """
+    def parse(u):
+        s = u.astype("string").str.strip().str.upper()
+        parts = s.str.extract(GRADE_COATING_RE)
+        if grades is not None:
+            parts["base"] = grades.resolve_series(u).fillna(parts["base"])
+        base = parts["base"].fillna(s.str.split().str[0])
+        out = pd.DataFrame({"base": base, "coat": parts["coat"]}).astype(object)
+        return out.where(out.notna(), np.nan)
+    out = map_unique(material, parse).infer_objects()
+    return out["base"], out["coat"]
 
 # ---------- supplier 1 cleaning ----------
 def clean_supplier1(path: str) -> pd.DataFrame:
-    df = pd.read_excel(path)
+    return clean_supplier1_frame(pd.read_excel(path))
 
+def clean_supplier1_frame(df: pd.DataFrame) -> pd.DataFrame:
     rename = {
         "Quality/Choice": "quality",
         "Grade": "grade",
@@ -51,7 +78,7 @@ def clean_supplier1(path: str) -> pd.DataFrame:
 
     for col in ["thickness_mm", "width_mm", "weight_kg", "rp02", "rm", "ag", "ai", "quantity"]:
         if col in df.columns:
-            df[col] = df[col].apply(to_float)
+            df[col] = to_float_series(df[col])
 
     df["source"] = "supplier1"
     df["article_id"] = np.nan
@@ -66,9 +93,10 @@ def clean_supplier1(path: str) -> pd.DataFrame:
     ]]
 
 # ---------- supplier 2 cleaning ----------
-def clean_supplier2(path: str) -> pd.DataFrame:
-    df = pd.read_excel(path)
+def clean_supplier2(path: str, grades=None) -> pd.DataFrame:
+    return clean_supplier2_frame(pd.read_excel(path), grades)
 
+def clean_supplier2_frame(df: pd.DataFrame, grades=None) -> pd.DataFrame:
     rename = {
         "Material": "material_full",
         "Description": "description",
@@ -81,22 +109,21 @@ def clean_supplier2(path: str) -> pd.DataFrame:
 
     for col in ["weight_kg", "quantity"]:
         if col in df.columns:
-            df[col] = df[col].apply(to_float)
+            df[col] = to_float_series(df[col])
 
     if "material_full" in df.columns:
-        grade_coat = df["material_full"].apply(extract_grade_and_coating)
-        df["grade"] = grade_coat.apply(lambda t: t[0])
+        df["grade"], coating = grade_and_coating_series(df["material_full"], grades)
         # Replace 0 or np.nan with empty string for Excel readability
-        df["coating"] = grade_coat.apply(lambda t: t[1] if pd.notna(t[1]) else "")
+        df["coating"] = coating.fillna("")
 
     if "reserved" in df.columns:
-        df["reserved"] = df["reserved"].astype(str).str.strip().str.lower().map(
+        df["reserved"] = map_unique(df["reserved"], lambda u: u.astype(str).str.strip().str.lower().map(
             {
                 "true": True, "yes": True, "1": True,
                 "false": False, "no": False, "0": False,
                 "vanilla": True, "not reserved": False
             }
-        )
+        ))
 
     for col in ["quality","finish","thickness_mm","width_mm","rp02","rm","ag","ai"]:
         if col not in df.columns:
@@ -111,9 +138,16 @@ def clean_supplier2(path: str) -> pd.DataFrame:
     ]]
 
 # ---------- main ----------
-def build_inventory(file1: str, file2: str, out_path: str):
+def _grade_index(reference_path):
+    """Shared grade resolution index (rfq_grades) for supplier materials, if a reference is given."""
+    if not reference_path:
+        return None
+    import rfq_grades
+    return rfq_grades.load_grade_index(reference_path)
+
+def build_inventory(file1: str, file2: str, out_path: str, reference_path: str = None):
     s1 = clean_supplier1(file1)
-    s2 = clean_supplier2(file2)
+    s2 = clean_supplier2(file2, _grade_index(reference_path))
     inv = pd.concat([s1, s2], ignore_index=True)
 
     # Deduplicate conservatively
@@ -133,10 +167,183 @@ def build_inventory(file1: str, file2: str, out_path: str):
 
     print(f"[OK] wrote {out_path} with {len(inv)} rows")
 
+# ---------- streaming ingestion ----------
+INVENTORY_COLUMNS = [
+    "grade","quality","finish","thickness_mm","width_mm","description",
+    "weight_kg","quantity","rp02","rm","ag","ai","article_id","reserved",
+    "material_full","source","coating"
+]
+DEDUP_COLUMNS = ["grade","finish","thickness_mm","width_mm","article_id","description","source"]
+# Columns that are float64 in the concatenated in-memory inventory (reserved included:
+# supplier1's all-NaN column makes the concat upcast supplier2's booleans to 0.0/1.0)
+FLOAT_COLUMNS = ["thickness_mm","width_mm","weight_kg","quantity","rp02","rm","ag","ai","article_id","reserved"]
+
+def iter_excel_chunks(path: str, chunk_rows: int = 50000):
+    """Yield the first sheet of a workbook as DataFrames of ``chunk_rows`` rows.
+
+    The workbook is opened in openpyxl read-only mode, so rows are parsed lazily
+    and only one chunk is held in memory. Fully empty rows are skipped.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        buf = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buf.append(row)
+            if len(buf) >= chunk_rows:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+def _conform(df: pd.DataFrame) -> pd.DataFrame:
+    """Give every chunk the dtypes the concatenated inventory has, so output and dedup keys match."""
+    df = df.copy()
+    for col in FLOAT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+    for col in INVENTORY_COLUMNS:
+        if col not in FLOAT_COLUMNS:
+            df[col] = df[col].astype(object)
+    return df
+
+def _clean_file_to_parts(task):
+    """Worker: stream one supplier file, clean each chunk and pickle it to ``part_dir``."""
+    supplier, path, part_dir, chunk_rows, reference_path = task
+    grades = _grade_index(reference_path) if supplier == "supplier2" else None
+    parts = []
+    for i, chunk in enumerate(iter_excel_chunks(path, chunk_rows)):
+        part = os.path.join(part_dir, f"{supplier}_{i:06d}.pkl")
+        frame = clean_supplier1_frame(chunk) if supplier == "supplier1" else clean_supplier2_frame(chunk, grades)
+        _conform(frame).to_pickle(part)
+        parts.append(part)
+    return parts
+
+def _sql_value(v):
+    """Dedup key cell as a SQLite value; NaN becomes NULL, matched with ``IS``."""
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    if isinstance(v, np.generic):
+        return v.item()
+    return v if isinstance(v, (str, int, float, bytes)) else str(v)
+
+class SeenKeys:
+    """Dedup keys already written, kept exactly in an on-disk SQLite table.
+
+    Rows are compared on their key values (NULL ``IS`` NULL, like pandas'
+    duplicated), so distinct rows are never dropped by a hash collision, and
+    memory stays at SQLite's page cache however many unique rows were written.
+    """
+
+    def __init__(self, path, n_keys):
+        self.db = sqlite3.connect(path)
+        self.cols = [f"k{i}" for i in range(n_keys)]
+        cols = ", ".join(self.cols)
+        self.db.execute(f"CREATE TABLE seen ({cols})")
+        self.db.execute(f"CREATE INDEX seen_keys ON seen ({cols})")
+        self.db.execute(f"CREATE TEMP TABLE chunk (rowno INTEGER PRIMARY KEY, {cols})")
+        self.match = " AND ".join(f"s.{c} IS c.{c}" for c in self.cols)
+
+    def add_new(self, keys: pd.DataFrame) -> np.ndarray:
+        """Mask of ``keys`` rows not seen before (first occurrence within ``keys``); records them."""
+        keep = ~keys.duplicated().to_numpy()
+        rows = [(i, *map(_sql_value, row)) for i, row in zip(np.flatnonzero(keep).tolist(),
+                                                             keys[keep].itertuples(index=False))]
+        holders = ", ".join("?" * (len(self.cols) + 1))
+        with self.db:
+            self.db.execute("DELETE FROM chunk")
+            self.db.executemany(f"INSERT INTO chunk VALUES ({holders})", rows)
+            found = [r for r, in self.db.execute(
+                f"SELECT rowno FROM chunk c WHERE EXISTS (SELECT 1 FROM seen s WHERE {self.match})")]
+            keep[found] = False
+            self.db.executemany("DELETE FROM chunk WHERE rowno = ?", [(r,) for r in found])
+            self.db.execute(f"INSERT INTO seen SELECT {', '.join(self.cols)} FROM chunk")
+        return keep
+
+    def close(self):
+        self.db.close()
+
+def build_inventory_streaming(file1: str, file2: str, out_path: str, chunk_rows: int = 50000,
+                              workers: int = 2, write_excel: bool = True, reference_path: str = None):
+    """Streaming build_inventory for large exports; same output files.
+
+    Supplier files are read and cleaned in parallel, chunk by chunk, into temporary
+    parts. The parts are then deduplicated in supplier order against the exact keys
+    already written (SeenKeys, on disk) and appended to the CSV (and a write-only
+    XLSX), so memory depends on the chunk size rather than the file size.
+    """
+    out_dir = os.path.dirname(out_path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+    part_dir = tempfile.mkdtemp(prefix="inventory_parts_", dir=out_dir)
+    tasks = [("supplier1", file1, part_dir, chunk_rows, reference_path),
+             ("supplier2", file2, part_dir, chunk_rows, reference_path)]
+    closing = []
+    try:
+        if workers > 1:
+            with get_context().Pool(min(workers, len(tasks))) as pool:
+                parts = pool.map(_clean_file_to_parts, tasks)
+        else:
+            parts = [_clean_file_to_parts(t) for t in tasks]
+
+        wb = ws = None
+        if write_excel:
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet()
+            ws.append(INVENTORY_COLUMNS)
+
+        seen, n_rows = SeenKeys(os.path.join(part_dir, "seen.sqlite"), len(DEDUP_COLUMNS)), 0
+        closing.append(seen)
+        with open(out_path, "w", encoding="utf-8", newline="") as f:
+            pd.DataFrame(columns=INVENTORY_COLUMNS).to_csv(f, index=False)
+            for part in parts[0] + parts[1]:
+                inv = pd.read_pickle(part)
+                inv = inv[seen.add_new(inv[DEDUP_COLUMNS])]
+                inv["coating"] = inv["coating"].astype("string").fillna("")
+                inv.to_csv(f, header=False, index=False)
+                if ws is not None:
+                    for row in inv.astype(object).itertuples(index=False):
+                        ws.append([None if pd.isna(v) else v for v in row])
+                n_rows += len(inv)
+        if wb is not None:
+            wb.save(out_path.replace(".csv", ".xlsx"))
+    finally:
+        for seen in closing:
+            seen.close()
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    print(f"[OK] wrote {out_path} with {n_rows} rows")
+
 # ---------- run ----------
 if __name__ == "__main__":
-    build_inventory(
-        file1="data/supplier_data1.xlsx",
-        file2="data/supplier_data2.xlsx",
-        out_path="outputs/inventory_dataset.csv"
-    )
+    parser = argparse.ArgumentParser(description="Clean and merge supplier inventories.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="read workbooks in chunks and process suppliers in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--reference", default="data/reference_properties.tsv",
+                        help="resolve supplier material grades against this reference ('' to skip)")
+    args = parser.parse_args()
+
+    if args.streaming:
+        build_inventory_streaming(
+            file1="data/supplier_data1.xlsx",
+            file2="data/supplier_data2.xlsx",
+            out_path="outputs/inventory_dataset.csv",
+            chunk_rows=args.chunk_rows,
+            reference_path=args.reference
+        )
+    else:
+        build_inventory(
+            file1="data/supplier_data1.xlsx",
+            file2="data/supplier_data2.xlsx",
+            out_path="outputs/inventory_dataset.csv",
+            reference_path=args.reference
+        )
@@ -0,0 +1,16 @@
+# tests/conftest.py
+import os
+import sys
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+DATA = os.path.join(REPO, "data")
+
+@pytest.fixture(scope="session")
+def rfq_enriched(tmp_path_factory):
+    """Enriched data/rfq.csv, built in a temporary store so outputs/ is left alone."""
+    import rfq_store
+    tmp = tmp_path_factory.mktemp("enriched")
+    return rfq_store.load_or_enrich(os.path.join(DATA, "rfq.csv"), os.path.join(DATA, "reference_properties.tsv"),
+                                    str(tmp / "store"), cache_dir=str(tmp / "cache"))
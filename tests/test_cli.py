@@ -0,0 +1,12 @@
+# tests/test_cli.py
+import os
+import cli
+import rfq_service
+from conftest import DATA
+
+def test_serve_index_defaults_to_out_dir(tmp_path, monkeypatch):
+    served = []
+    monkeypatch.setattr(rfq_service, "serve", lambda index, *args, **options: served.append(index))
+    cli.main(["serve", "--data-dir", DATA, "--out-dir", str(tmp_path)])
+    assert os.path.exists(tmp_path / "similarity_index" / "meta.json")
+    assert len(served[0]) > 0
@@ -0,0 +1,18 @@
+# tests/test_clustering.py
+import numpy as np
+import pandas as pd
+import rfq_clustering
+
+def reference_summary(rfq_filtered):
+    """The original per-cluster loop."""
+    summary = {}
+    for cluster_id, group in rfq_filtered.groupby("cluster"):
+        numeric_means = group.select_dtypes(include=[np.number]).mean()
+        categorical_modes = group.select_dtypes(exclude=[np.number]).mode().iloc[0]
+        summary[cluster_id] = pd.concat([numeric_means, categorical_modes])
+    return pd.DataFrame(summary).T
+
+def test_cluster_summary_matches_per_cluster_loop(rfq_enriched):
+    clustered = rfq_enriched.assign(cluster=np.arange(len(rfq_enriched)) % 5)
+    pd.testing.assert_frame_equal(rfq_clustering.cluster_summary(clustered), reference_summary(clustered),
+                                  check_exact=True)
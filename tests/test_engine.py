@@ -0,0 +1,19 @@
+# tests/test_engine.py
+import pandas as pd
+import rfq_final
+
+def test_streamed_top_k_equals_in_memory(rfq_enriched, tmp_path):
+    book = rfq_enriched.head(150)
+    in_memory = rfq_final.compute_top3_similarity(book)
+    streamed = rfq_final.compute_top3_similarity(book, out_dir=str(tmp_path / "chunks"), block_size=64)
+    pd.testing.assert_frame_equal(streamed.reset_index(drop=True), in_memory.reset_index(drop=True),
+                                  check_exact=True)
+
+def test_streamed_top_k_resumes_exactly(rfq_enriched, tmp_path, capsys):
+    book = rfq_enriched.head(150)
+    out_dir = str(tmp_path / "chunks")
+    first = rfq_final.compute_top3_similarity(book, out_dir=out_dir, block_size=64)
+    # A second run reads the finished chunks back, silently
+    second = rfq_final.compute_top3_similarity(book, out_dir=out_dir, block_size=64)
+    pd.testing.assert_frame_equal(first, second, check_exact=True)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,24 @@
+# tests/test_matching.py
+import os
+import numpy as np
+import pandas as pd
+import rfq_matching
+from conftest import DATA
+
+def test_aliased_rfq_grade_reaches_resolved_lots():
+    inventory = pd.DataFrame({"article_id": ["A1", "A2", "A3"], "grade": ["S355J2", "S235JR", "S355J2"],
+                              "coating": [None, None, "+Z140"], "thickness_mm": [2.0, 2.0, 2.5],
+                              "width_mm": [1000.0, 1000.0, 1200.0], "weight_kg": [500.0, 500.0, 500.0]})
+    index = rfq_matching.build_inventory_index(inventory, os.path.join(DATA, "reference_properties.tsv"))
+    rfq = pd.DataFrame({"id": ["q1", "q2"], "grade": ["s355-j2", "S355 J2"], "coating": [None, "Z140"],
+                        "thickness_min": [1.5, np.nan], "thickness_max": [3.0, np.nan]})
+    matches = rfq_matching.match_rfqs(rfq, index, k=3)
+    assert sorted(matches[matches["rfq_id"] == "q1"]["article_id"]) == ["A1", "A3"]
+    assert matches[matches["rfq_id"] == "q2"]["article_id"].tolist() == ["A3"]
+
+def test_unknown_grades_still_match_by_spelling():
+    inventory = pd.DataFrame({"article_id": ["A1"], "grade": [" zz-unknown "], "thickness_mm": [2.0],
+                              "width_mm": [1000.0]})
+    index = rfq_matching.build_inventory_index(inventory, os.path.join(DATA, "reference_properties.tsv"))
+    matches = rfq_matching.match_rfqs(pd.DataFrame({"id": ["q1"], "grade": ["ZZ-UNKNOWN"]}), index)
+    assert matches["article_id"].tolist() == ["A1"]
@@ -0,0 +1,42 @@
+# tests/test_service.py
+import asyncio
+import json
+import os
+import pytest
+import rfq_lookup
+import rfq_service
+from conftest import DATA
+
+@pytest.fixture(scope="module")
+def index(rfq_enriched):
+    return rfq_lookup.SimilarityIndex.build(rfq_enriched.head(200), os.path.join(DATA, "reference_properties.tsv"))
+
+def ask(index, requests, tmp_path):
+    """Send raw request lines over a Unix socket; replies by tag."""
+    async def run():
+        service = rfq_service.MatchService(index)
+        path = str(tmp_path / "service.sock")
+        server = await service.start(path=path)
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b"".join(json.dumps(r).encode() + b"\n" for r in requests))
+            await writer.drain()
+            replies = [json.loads(await reader.readline()) for _ in requests]
+            writer.close()
+            return {reply["tag"]: reply for reply in replies}
+        finally:
+            await service.stop(server)
+    return asyncio.run(run())
+
+def test_missing_rfq_is_bad_request(index, tmp_path):
+    reply = ask(index, [{"tag": 1, "k": 3}], tmp_path)[1]
+    assert reply["error"] == "bad_request"
+    assert reply["detail"] == "missing 'rfq' object"
+
+@pytest.mark.parametrize("k", [True, False, 0, 2.0, "3"])
+def test_non_integer_k_is_bad_request(index, rfq_enriched, tmp_path, k):
+    rfq = {"grade": rfq_enriched["grade"].dropna().iloc[0]}
+    replies = ask(index, [{"tag": 1, "rfq": rfq, "k": k}, {"tag": 2, "rfq": rfq, "k": 1}], tmp_path)
+    assert replies[1]["error"] == "bad_request"
+    # The bad request does not affect the one next to it
+    assert len(replies[2]["matches"]) == 1